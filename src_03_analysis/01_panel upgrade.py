@@ -24,6 +24,13 @@ import seaborn as sns
 from linearmodels import PanelOLS
 import warnings
 import statsmodels.api as sm
+import os
+import sys
+
+sys.path.append(os.path.abspath(".."))
+from utils.dev_mode import dev_input, dev_output, load_dev_mode
+from utils.feature_store import PanelScope, load_features
+from utils.winsorize import winsorization_bounds, apply_bounds
 
 warnings.filterwarnings('ignore')
 
@@ -37,14 +44,28 @@ plt.rcParams.update({
 })
 
 # Constants
-DATA_PATH = Path("../data/data_ready/merged_panel_winsorized.parquet")
-RESULTS_PATH = Path("../reports/")
-PLOTS_PATH = Path("../plots/")
+# Dev mode (utils/dev_mode.py): sampled firms only, inputs and outputs under dev/<namespace>/
+DEV_MODE = load_dev_mode()
+DATA_PATH = dev_input(Path("../data/data_ready/merged_panel_winsorized.parquet"), DEV_MODE)
+FEATURE_STORE_PATH = dev_output(Path("../data/feature_store/"), DEV_MODE)
+RESULTS_PATH = dev_output(Path("../reports/"), DEV_MODE)
+PLOTS_PATH = dev_output(Path("../plots/"), DEV_MODE)
 MIN_YEARS_FIRM = 4
 YEAR_START = 2003
 YEAR_END = 2023
 FIRM_ID_COL = "firm_ico"
 
+# Panel columns (catalog sets, see utils/catalog.py) and engineered features
+# (utils/feature_store.py) loaded for the analysis
+PANEL_VARIABLES = [
+    "ecm_core", "firm_total_assets", "sector_level1_avg_wages_by_nace", "macro_shocks",
+    "mac_GAP", "mac_NLGXQ", "sector_ids", "sector_ppi",
+]
+PANEL_FEATURES = [
+    "d_operating_margin", "l_operating_margin", "l_d_operating_margin", "firm_age", "log_assets",
+    "leverage_ratio", "sales_growth", "l_leverage_ratio", "l_log_assets", "sector_wage_growth",
+]
+
 # Create directories if they don't exist
 RESULTS_PATH.mkdir(exist_ok=True)
 PLOTS_PATH.mkdir(exist_ok=True)
@@ -97,23 +118,16 @@ inflation_annual = (
 # Load the pre-processed panel data and apply final filters for the analysis.
 
 # %%
-# Load the panel data using Polars for efficiency
+# Load the scoped panel (period, non-missing margin, firms with enough years)
+# with its engineered features. The feature store materialises them once per
+# panel version and feature definitions; later runs only map the columns.
 print(f"Loading data from: {DATA_PATH}")
-df_lazy = pl.scan_parquet(DATA_PATH)
-
-# Apply initial filters for the relevant period and required variables
-df_panel = (
-    df_lazy
-    .filter(pl.col("year").is_between(YEAR_START, YEAR_END))
-    .filter(pl.col("firm_operating_margin_cal").is_not_null())
-    .collect()
+panel_scope = PanelScope(YEAR_START, YEAR_END, ("firm_operating_margin_cal",), MIN_YEARS_FIRM)
+df_panel_filtered = load_features(
+    str(DATA_PATH), str(FEATURE_STORE_PATH), *PANEL_VARIABLES,
+    features=PANEL_FEATURES, scope=panel_scope, strict=False,
 )
 
-# Filter for firms with a sufficient number of observations
-firm_counts = df_panel.group_by(FIRM_ID_COL).count()
-firms_to_keep = firm_counts.filter(pl.col("count") >= MIN_YEARS_FIRM).select(FIRM_ID_COL)
-df_panel_filtered = df_panel.join(firms_to_keep, on=FIRM_ID_COL, how="inner")
-
 print(f"Shape after initial filtering: {df_panel_filtered.shape}")
 print(f"Unique firms retained: {df_panel_filtered[FIRM_ID_COL].n_unique():,}")
 
@@ -130,20 +144,11 @@ print("="*60)
 print("CONSTRUCTING & CLEANING MODEL VARIABLES (Corrected Wage Growth)")
 print("="*60)
 
-# --- Step 1: Create a clean, de-duplicated time series of sectoral wages ---
-wage_ts = (
-    df_panel_filtered
-    .select(["year", "level1_nace_code", "sector_level1_avg_wages_by_nace"])
-    .unique()
-    .sort("level1_nace_code", "year")
-)
-
-# --- Step 2: Calculate the YoY growth rate correctly on the clean time series ---
-wage_ts_growth = wage_ts.with_columns(
-    (
-        pl.col("sector_level1_avg_wages_by_nace").pct_change(1).over("level1_nace_code") * 100
-    ).alias("sector_wage_growth")
-)
+# --- Steps 1-2: Engineered variables come from the feature store ---
+# (utils/feature_store.py, FEATURE_REGISTRY): the ECM terms, firm age, log assets,
+# leverage, sales growth, their year-indexed lags, and sector_wage_growth, the
+# YoY growth of sector_level1_avg_wages_by_nace computed on the de-duplicated
+# (level1_nace_code, year) series and joined back to the firms.
 
 # --- Step 3: Define Macro Shocks Map ---
 macro_shocks_map = {
@@ -155,64 +160,30 @@ macro_shocks_map = {
     'fiscal_balance': 'mac_NLGXQ'
 }
 
-# --- Step 4: Build the final DataFrame by joining the corrected wage growth ---
+# --- Step 4: Build the final DataFrame ---
 df_final = (
     df_panel_filtered
-    # Join the correctly calculated wage growth back to the main panel
-    .join(
-        wage_ts_growth.select(["year", "level1_nace_code", "sector_wage_growth"]),
-        on=["year", "level1_nace_code"],
-        how="left"
-    )
-    .sort(FIRM_ID_COL, "year") # Sort by firm and year for firm-level calcs
-    .with_columns([
-        # OUTCOME: First-difference of the operating margin
-        pl.col("firm_operating_margin_cal").diff(1).over(FIRM_ID_COL).alias("d_operating_margin"),
-
-        # ECM TERM 1: Lagged LEVEL of the operating margin
-        pl.col("firm_operating_margin_cal").shift(1).over(FIRM_ID_COL).alias("l_operating_margin"),
-
-        # FIRM-LEVEL CONTROLS
-        (pl.col("year") - pl.col("firm_year_founded")).alias("firm_age"),
-        pl.col("firm_total_assets").log().alias("log_assets"),
-        pl.when(pl.col("firm_total_liabilities_and_equity") > 0)
-        .then((pl.col("firm_total_liabilities_and_equity") - pl.col("firm_equity")) / pl.col("firm_total_liabilities_and_equity"))
-        .otherwise(None)
-        .alias("leverage_ratio"),
-
-        # sales growth 
-        (pl.col("firm_sales_revenue").log().diff(1).over(FIRM_ID_COL)*100).alias("sales_growth"),
-
-    ])
-    .with_columns([
-        # ECM TERM 2: Lagged CHANGE in the operating margin
-        pl.col("d_operating_margin").shift(1).over(FIRM_ID_COL).alias("l_d_operating_margin"),
-        
-        # Lagged firm controls to mitigate simultaneity
-        pl.col("leverage_ratio").shift(1).over(FIRM_ID_COL).alias("l_leverage_ratio"),
-        pl.col("log_assets").shift(1).over(FIRM_ID_COL).alias("l_log_assets"),
-    ])
     .rename({v: k for k, v in macro_shocks_map.items()})
     .drop_nulls("d_operating_margin")
 )
 
-# --- Step 5: Convert to Pandas & Winsorize Outliers ---
-df_pd = df_final.to_pandas().set_index([FIRM_ID_COL, 'year'])
-
+# --- Step 5: Winsorize Outliers (all bounds in one pass) & Convert to Pandas ---
 print("\n--- Winsorizing data to handle extreme outliers ---")
 vars_to_winsorize = [
     'd_operating_margin', 'l_operating_margin', 'l_d_operating_margin',
     'l_leverage_ratio', 'l_log_assets', 'sales_growth'
 ]
-for var in vars_to_winsorize:
-    if var in df_pd.columns:
-        # Important: drop NaNs before calculating quantiles
-        valid_data = df_pd[var].dropna()
-        if not valid_data.empty:
-            lower_bound = valid_data.quantile(0.01)
-            upper_bound = valid_data.quantile(0.99)
-            df_pd[var] = df_pd[var].clip(lower=lower_bound, upper=upper_bound)
-            print(f"Variable '{var}' clipped between {lower_bound:.2f} and {upper_bound:.2f}")
+# Quantiles ignore nulls and non-finite values (e.g. log of zero assets)
+winsor_cols = [var for var in vars_to_winsorize if var in df_final.columns]
+winsor_bounds = winsorization_bounds(df_final, winsor_cols, by=None, interpolation="linear")
+df_final = apply_bounds(df_final, winsor_bounds, winsor_cols, by=None)
+for var in winsor_cols:
+    lower_bound = winsor_bounds[f"{var}__lower"].item()
+    upper_bound = winsor_bounds[f"{var}__upper"].item()
+    if lower_bound is not None:
+        print(f"Variable '{var}' clipped between {lower_bound:.2f} and {upper_bound:.2f}")
+
+df_pd = df_final.to_pandas().set_index([FIRM_ID_COL, 'year'])
 
 print("\n--- Descriptive Statistics (Post-Winsorization) ---")
 print(df_pd[vars_to_winsorize].describe().T[['mean', 'std', 'min', 'max']].round(3))
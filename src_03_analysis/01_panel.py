@@ -25,6 +25,14 @@ import seaborn as sns
 from linearmodels import PanelOLS, IV2SLS
 from statsmodels.iolib.summary2 import summary_col
 import warnings
+import os
+import sys
+
+sys.path.append(os.path.abspath(".."))
+from utils.dev_mode import dev_input, dev_output, load_dev_mode
+from utils.feature_store import PanelScope, load_features
+from utils.sample_masks import SampleMasks
+from utils.winsorize import winsorization_bounds, apply_bounds
 
 warnings.filterwarnings('ignore')
 
@@ -38,14 +46,22 @@ plt.rcParams.update({
 })
 
 # Constants
-DATA_PATH = Path("../data/data_ready/merged_panel_winsorized.parquet")
-RESULTS_PATH = Path("../reports/")
-PLOTS_PATH = Path("../plots/")
+# Dev mode (utils/dev_mode.py): sampled firms only, inputs and outputs under dev/<namespace>/
+DEV_MODE = load_dev_mode()
+DATA_PATH = dev_input(Path("../data/data_ready/merged_panel_winsorized.parquet"), DEV_MODE)
+FEATURE_STORE_PATH = dev_output(Path("../data/feature_store/"), DEV_MODE)
+RESULTS_PATH = dev_output(Path("../reports/"), DEV_MODE)
+PLOTS_PATH = dev_output(Path("../plots/"), DEV_MODE)
 MIN_YEARS_FIRM = 4
 YEAR_START = 2003
 YEAR_END = 2023
 FIRM_ID_COL = "firm_ico"
 
+# Panel columns (catalog sets, see utils/catalog.py) and engineered features
+# (utils/feature_store.py) loaded for the analysis
+PANEL_VARIABLES = ["ecm_core", "macro_shocks", "mac_GAP", "mac_NLGXQ", "sector_ids", "sector_ppi", "firm_main_nace_code"]
+PANEL_FEATURES = ["d_operating_margin", "l_operating_margin", "l_d_operating_margin", "firm_age", "leverage_ratio", "leverage_lag"]
+
 # Create directories if they don't exist
 RESULTS_PATH.mkdir(exist_ok=True)
 PLOTS_PATH.mkdir(exist_ok=True)
@@ -60,23 +76,16 @@ print(f"Analysis period: {YEAR_START}-{YEAR_END}")
 # Load the pre-processed panel data and apply final filters for the analysis.
 
 # %%
-# Load the panel data using Polars for efficiency
+# Load the scoped panel (period, non-missing margin, firms with enough years)
+# with its engineered features. The feature store materialises them once per
+# panel version and feature definitions; later runs only map the columns.
 print(f"Loading data from: {DATA_PATH}")
-df_lazy = pl.scan_parquet(DATA_PATH)
-
-# Apply initial filters for the relevant period and required variables
-df_panel = (
-    df_lazy
-    .filter(pl.col("year").is_between(YEAR_START, YEAR_END))
-    .filter(pl.col("firm_operating_margin_cal").is_not_null())
-    .collect()
+panel_scope = PanelScope(YEAR_START, YEAR_END, ("firm_operating_margin_cal",), MIN_YEARS_FIRM)
+df_panel_filtered = load_features(
+    str(DATA_PATH), str(FEATURE_STORE_PATH), *PANEL_VARIABLES,
+    features=PANEL_FEATURES, scope=panel_scope, strict=False,
 )
 
-# Filter for firms with a sufficient number of observations
-firm_counts = df_panel.group_by(FIRM_ID_COL).count()
-firms_to_keep = firm_counts.filter(pl.col("count") >= MIN_YEARS_FIRM).select(FIRM_ID_COL)
-df_panel_filtered = df_panel.join(firms_to_keep, on=FIRM_ID_COL, how="inner")
-
 print(f"Shape after initial filtering: {df_panel_filtered.shape}")
 print(f"Unique firms retained: {df_panel_filtered[FIRM_ID_COL].n_unique():,}")
 
@@ -110,47 +119,28 @@ for name, var in available_shocks.items():
     print(f"  - {name}: `{var}`")
 
 
-# --- 2.2. Create Core Model & Leverage Variables ---
+# --- 2.2. Core Model & Leverage Variables ---
+# d_operating_margin (outcome), l_operating_margin and l_d_operating_margin (ECM
+# terms), firm_age, leverage_ratio and leverage_lag come from the feature store
+# (utils/feature_store.py, FEATURE_REGISTRY); lags are year-indexed within firm.
 df_final = (
     df_panel_filtered
-    .sort(FIRM_ID_COL, "year")
-    .with_columns([
-        # OUTCOME: First-difference of the operating margin
-        pl.col("firm_operating_margin_cal").diff(1).over(FIRM_ID_COL).alias("d_operating_margin"),
-
-        # ECM TERM 1: Lagged LEVEL of the operating margin
-        pl.col("firm_operating_margin_cal").shift(1).over(FIRM_ID_COL).alias("l_operating_margin"),
-
-        # TIME-VARYING FIRM CONTROL
-        (pl.col("year") - pl.col("firm_year_founded")).alias("firm_age"),
-
-        # LEVERAGE RATIO
-        pl.when(pl.col("firm_total_liabilities_and_equity") > 0)
-        .then((pl.col("firm_total_liabilities_and_equity") - pl.col("firm_equity")) / pl.col("firm_total_liabilities_and_equity"))
-        .otherwise(None)
-        .alias("leverage_ratio")
-    ])
-    .with_columns([
-        # ECM TERM 2: Lagged CHANGE in the operating margin
-        pl.col("d_operating_margin").shift(1).over(FIRM_ID_COL).alias("l_d_operating_margin"),
-        # LAGGED LEVERAGE (to mitigate simultaneity)
-        pl.col("leverage_ratio").shift(1).over(FIRM_ID_COL).alias("leverage_lag")
-    ])
     .rename({v: k for k, v in available_shocks.items()})
     .drop_nulls("d_operating_margin")
 )
 
-# --- 2.3. Convert to Pandas & Winsorize Outliers ---
-df_pd = df_final.to_pandas().set_index([FIRM_ID_COL, 'year'])
-
+# --- 2.3. Winsorize Outliers (all bounds in one pass) & Convert to Pandas ---
 print("\n--- Winsorizing data to handle extreme outliers ---")
 vars_to_winsorize = ['d_operating_margin', 'l_operating_margin', 'l_d_operating_margin']
+winsor_bounds = winsorization_bounds(df_final, vars_to_winsorize, by=None, interpolation="linear")
+df_final = apply_bounds(df_final, winsor_bounds, vars_to_winsorize, by=None)
 for var in vars_to_winsorize:
-    lower_bound = df_pd[var].quantile(0.01)
-    upper_bound = df_pd[var].quantile(0.99)
-    df_pd[var] = df_pd[var].clip(lower=lower_bound, upper=upper_bound)
+    lower_bound = winsor_bounds[f"{var}__lower"].item()
+    upper_bound = winsor_bounds[f"{var}__upper"].item()
     print(f"Variable '{var}' clipped between {lower_bound:.2f} and {upper_bound:.2f}")
 
+df_pd = df_final.to_pandas().set_index([FIRM_ID_COL, 'year'])
+
 print("\n--- Descriptive Statistics (Post-Winsorization) ---")
 desc_stats = df_pd[vars_to_winsorize].describe().T
 print(desc_stats[['mean', 'std', 'min', 'max']].round(3))
@@ -179,16 +169,22 @@ macro_shocks = list(available_shocks.keys())
 exog_vars_static = macro_shocks + firm_controls
 exog_vars_dynamic = ['l_operating_margin', 'l_d_operating_margin'] + macro_shocks + firm_controls
 
-# Create final regression sample by dropping any remaining missing values
-df_reg = df_pd.dropna(subset=[dependent] + exog_vars_dynamic)
-print(f"Final regression sample size: {len(df_reg):,} observations")
+# Estimation samples are row bitsets over df_pd (utils/sample_masks.py): one per
+# variable set, intersected with sector and period masks. Models receive (y, X)
+# gathered at the selected rows instead of copies of the full frame.
+masks = SampleMasks(df_pd)
+
+# Final regression sample: rows without missing values in the model variables
+reg_sample = masks.complete([dependent] + exog_vars_dynamic)
+print(f"Final regression sample size: {masks.count(reg_sample):,} observations")
 
 
 # --- Model 1: Dynamic Error Correction Model (Preferred Model) ---
 print("\n--- [Model 1] Dynamic Error Correction Model (ECM) ---")
+y_dynamic, X_dynamic = masks.design(dependent, exog_vars_dynamic, reg_sample)
 mod_ecm = PanelOLS(
-    df_reg[dependent],
-    df_reg[exog_vars_dynamic],
+    y_dynamic,
+    X_dynamic,
     entity_effects=True
 )
 res_ecm = mod_ecm.fit(cov_type='clustered', cluster_entity=True)
@@ -216,17 +212,21 @@ print("HETEROGENEITY ANALYSIS 1: LEVERAGE & MONETARY POLICY")
 print("="*60)
 
 # Create leverage groups for firms where we have the data
-df_leverage = df_pd.dropna(subset=['leverage_lag'])
-median_leverage = df_leverage['leverage_lag'].median()
-df_leverage['leverage_group'] = np.where(df_leverage['leverage_lag'] > median_leverage, 'High Leverage', 'Low Leverage')
+leverage_sample = masks.complete(['leverage_lag'])
+median_leverage = masks.column('leverage_lag', leverage_sample).median()
+high_leverage = masks.pack(df_pd['leverage_lag'] > median_leverage)
+leverage_groups = {
+    'High Leverage': leverage_sample & high_leverage,
+    'Low Leverage': leverage_sample & ~high_leverage,
+}
 print(f"Splitting firms by median leverage of {median_leverage:.2f}")
 
 leverage_results = {}
-for group in ['High Leverage', 'Low Leverage']:
-    df_group = df_leverage[df_leverage['leverage_group'] == group]
-    if len(df_group) > 1000:
-        print(f"\n--- Running ECM for: {group} Firms (N={len(df_group):,}) ---")
-        mod = PanelOLS(df_group[dependent], df_group[exog_vars_dynamic], entity_effects=True)
+for group, group_sample in leverage_groups.items():
+    n_group = masks.count(group_sample)
+    if n_group > 1000:
+        print(f"\n--- Running ECM for: {group} Firms (N={n_group:,}) ---")
+        mod = PanelOLS(*masks.design(dependent, exog_vars_dynamic, group_sample), entity_effects=True)
         leverage_results[group] = mod.fit(cov_type='clustered', cluster_entity=True)
         # Print the key coefficient for policy rate
         print(leverage_results[group].params.filter(like='policy_rate'))
@@ -259,16 +259,17 @@ print("HETEROGENEITY ANALYSIS 2: BY NACE SECTOR")
 print("="*60)
 
 # Identify top 5 largest sectors by observation count
-top_sectors = df_reg['firm_main_nace_code'].value_counts().head(5).index.to_list()
+top_sectors = masks.column('firm_main_nace_code', reg_sample).value_counts().head(5).index.to_list()
 print(f"Analyzing top 5 sectors: {top_sectors}")
 
 sector_results = {}
 for sector in top_sectors:
-    df_sector = df_reg[df_reg['firm_main_nace_code'] == sector]
-    if len(df_sector) > 1000: # Ensure enough data
-        mod = PanelOLS(df_sector[dependent], df_sector[exog_vars_dynamic], entity_effects=True)
+    sector_sample = reg_sample & masks.equals('firm_main_nace_code', sector)
+    n_sector = masks.count(sector_sample)
+    if n_sector > 1000: # Ensure enough data
+        mod = PanelOLS(*masks.design(dependent, exog_vars_dynamic, sector_sample), entity_effects=True)
         sector_results[sector] = mod.fit(cov_type='clustered', cluster_entity=True)
-        print(f"\n--- Results for Sector: {sector} (N={len(df_sector):,}) ---")
+        print(f"\n--- Results for Sector: {sector} (N={n_sector:,}) ---")
         print(sector_results[sector].params.filter(like='inflation_rate'))
 
 
@@ -281,7 +282,7 @@ for sector in top_sectors:
 print("\n--- EXPORTING FINAL RESULTS TABLE ---")
 
 # Add a Static FE model for comparison
-mod_static = PanelOLS(df_reg[dependent], df_reg[exog_vars_static], entity_effects=True)
+mod_static = PanelOLS(*masks.design(dependent, exog_vars_static, reg_sample), entity_effects=True)
 res_static = mod_static.fit(cov_type='clustered', cluster_entity=True)
 
 # Manually construct a summary DataFrame since summary_col is incompatible with linearmodels.PanelOLS results
@@ -325,7 +326,7 @@ results_path_csv = RESULTS_PATH / "final_panel_results.csv"
 print("--- Creating time-series plot of margins and inflation ---")
 
 # Calculate annual averages from our regression sample for consistency
-plot_data = df_reg.groupby('year').agg({
+plot_data = masks.take(['l_operating_margin', 'inflation_rate'], reg_sample).groupby('year').agg({
     'l_operating_margin': 'mean',
     'inflation_rate': 'mean'
 }).reset_index()
@@ -368,21 +369,19 @@ print("\n" + "="*60)
 print("TESTING FOR A STRUCTURAL BREAK: INTERACTION MODEL")
 print("="*60)
 
-df_interaction = df_reg.copy()
-
 # Create the dummy variable for the episode
-df_interaction['episode_21_23'] = df_interaction.index.get_level_values('year').isin([2021, 2022, 2023]).astype(int)
+episode_21_23 = X_dynamic.index.get_level_values('year').isin([2021, 2022, 2023]).astype(int)
 
-# Create the interaction term
-df_interaction['inflation_x_episode'] = df_interaction['inflation_rate'] * df_interaction['episode_21_23']
+# Create the interaction term (on the design matrix of the regression sample)
+X_interaction = X_dynamic.assign(inflation_x_episode=X_dynamic['inflation_rate'] * episode_21_23)
 
 # Define the explanatory variables for this model
 exog_vars_interaction = exog_vars_dynamic + ['inflation_x_episode']
 
 # Run the PanelOLS model
 mod_interaction = PanelOLS(
-    df_interaction[dependent],
-    df_interaction[exog_vars_interaction],
+    y_dynamic,
+    X_interaction[exog_vars_interaction],
     entity_effects=True
 )
 res_interaction = mod_interaction.fit(cov_type='clustered', cluster_entity=True)
@@ -424,15 +423,15 @@ print("ROBUSTNESS CHECK: SUB-SAMPLE ANALYSIS")
 print("="*60)
 
 # Define the two periods
-df_normal_period = df_reg[df_reg.index.get_level_values('year') <= 2019]
-df_shock_period = df_reg[df_reg.index.get_level_values('year') > 2019]
+normal_sample = reg_sample & masks.period(end=2019)
+shock_sample = reg_sample & masks.period(start=2020)
 
-print(f"Observations in 'Normal Period' (pre-2020): {len(df_normal_period):,}")
-print(f"Observations in 'Shock Period' (2020-2023): {len(df_shock_period):,}")
+print(f"Observations in 'Normal Period' (pre-2020): {masks.count(normal_sample):,}")
+print(f"Observations in 'Shock Period' (2020-2023): {masks.count(shock_sample):,}")
 
 # --- Run Model on Normal Period ---
 print("\n--- Model for Normal Period (2004-2019) ---")
-mod_normal = PanelOLS(df_normal_period[dependent], df_normal_period[exog_vars_dynamic], entity_effects=True)
+mod_normal = PanelOLS(*masks.design(dependent, exog_vars_dynamic, normal_sample), entity_effects=True)
 res_normal = mod_normal.fit(cov_type='clustered', cluster_entity=True)
 inflation_coeff_normal = res_normal.params['inflation_rate']
 print(f"Coefficient on inflation_rate: {inflation_coeff_normal:.4f}")
@@ -440,7 +439,7 @@ print(res_normal.summary.tables[1]) # Display only the coefficients table
 
 # --- Run Model on Shock Period ---
 print("\n--- Model for Shock Period (2020-2023) ---")
-mod_shock = PanelOLS(df_shock_period[dependent], df_shock_period[exog_vars_dynamic], entity_effects=True)
+mod_shock = PanelOLS(*masks.design(dependent, exog_vars_dynamic, shock_sample), entity_effects=True)
 res_shock = mod_shock.fit(cov_type='clustered', cluster_entity=True)
 inflation_coeff_shock = res_shock.params['inflation_rate']
 print(f"Coefficient on inflation_rate: {inflation_coeff_shock:.4f}")
@@ -476,16 +475,15 @@ print("FIXING STANDARD ERRORS: RE-ESTIMATING WITH DRISCOLL-KRAAY")
 print("="*60)
 
 # Define the original 2021-2023 episode
-df_interaction = df_reg.copy()
-df_interaction['episode_21_23'] = df_interaction.index.get_level_values('year').isin([2021, 2022, 2023]).astype(int)
-df_interaction['inflation_x_episode'] = df_interaction['inflation_rate'] * df_interaction['episode_21_23']
+episode_21_23 = X_dynamic.index.get_level_values('year').isin([2021, 2022, 2023]).astype(int)
+X_interaction = X_dynamic.assign(inflation_x_episode=X_dynamic['inflation_rate'] * episode_21_23)
 exog_vars_interaction = exog_vars_dynamic + ['inflation_x_episode']
 
 # Re-run the model, specifying Driscoll-Kraay standard errors
 # This is the single most important correction to the model.
 mod_dk = PanelOLS(
-    df_interaction[dependent],
-    df_interaction[exog_vars_interaction],
+    y_dynamic,
+    X_interaction[exog_vars_interaction],
     entity_effects=True
 )
 # The 'kernel' choice determines the weighting, 'bartlett' is standard.
@@ -520,16 +518,14 @@ results_sensitivity = []
 
 for name, years in episode_definitions.items():
     print(f"--- Testing episode definition: {name} ---")
-    df_temp = df_reg.copy()
-    
     # Create dummy and interaction term for the current definition
-    df_temp['episode'] = df_temp.index.get_level_values('year').isin(years).astype(int)
-    df_temp['inflation_x_episode'] = df_temp['inflation_rate'] * df_temp['episode']
+    episode = X_dynamic.index.get_level_values('year').isin(years).astype(int)
+    X_temp = X_dynamic.assign(inflation_x_episode=X_dynamic['inflation_rate'] * episode)
     
     exog_temp = exog_vars_dynamic + ['inflation_x_episode']
     
     # Run the model with the corrected Driscoll-Kraay SEs
-    mod_sens = PanelOLS(df_temp[dependent], df_temp[exog_temp], entity_effects=True)
+    mod_sens = PanelOLS(y_dynamic, X_temp[exog_temp], entity_effects=True)
     res_sens = mod_sens.fit(cov_type='driscoll-kraay', kernel='bartlett')
     
     # Store the key results
@@ -590,19 +586,19 @@ print("="*60)
 # Check if the energy price variable is available
 if 'mac_hicp_pure_energy_roc' in df_final.columns:
     # Rename for cleaner output, assuming it wasn't in the primary_shocks dict before
-    if 'energy_prices_inflation' not in df_reg.columns:
-        df_reg['energy_prices_inflation'] = df_reg['mac_hicp_pure_energy_roc']
+    if 'energy_prices_inflation' not in df_pd.columns:
+        df_pd['energy_prices_inflation'] = df_pd['mac_hicp_pure_energy_roc']
 
     # Define a new set of explanatory variables including the energy shock
     exog_vars_energy = exog_vars_dynamic + ['energy_prices_inflation']
+    energy_sample = reg_sample & masks.complete(exog_vars_energy)
     
     # Ensure the variable is not all nulls in the regression sample
-    if df_reg['energy_prices_inflation'].notna().sum() > 0:
+    if masks.count(energy_sample) > 0:
         
-        # Run the ECM with the added energy variable
+        # Run the ECM with the added energy variable (rows with missing energy data dropped)
         mod_energy = PanelOLS(
-            df_reg[dependent],
-            df_reg.dropna(subset=exog_vars_energy)[exog_vars_energy], # Drop rows with missing energy data if any
+            *masks.design(dependent, exog_vars_energy, energy_sample),
             entity_effects=True
         )
         res_energy = mod_energy.fit(cov_type='driscoll-kraay', kernel='bartlett')
@@ -657,27 +653,23 @@ oecd_vars_to_add = {
 # Assuming your raw data `df_final` contains these columns from the initial merge
 if all(v in df_final.columns for v in oecd_vars_to_add.keys()):
     
-    df_final_controls = df_final.select(
-        [FIRM_ID_COL, 'year'] + list(oecd_vars_to_add.keys())
-    ).rename(oecd_vars_to_add)
-    
-    # Merge these into our main pandas regression frame
-    df_reg_final = df_reg.join(
-        df_final_controls.to_pandas().set_index([FIRM_ID_COL, 'year'])
-    )
+    # Add the controls under their model names (df_pd is row-aligned with df_final)
+    for source_col, control in oecd_vars_to_add.items():
+        df_pd[control] = df_pd[source_col]
 
     # --- Define the final, fully-specified model ---
     exog_vars_final = exog_vars_energy + ['output_gap', 'fiscal_balance']
     
     # Drop observations where the new controls are missing
-    df_reg_final = df_reg_final.dropna(subset=exog_vars_final)
+    final_sample = reg_sample & masks.complete(exog_vars_final)
     
-    print(f"Sample size for final model: {len(df_reg_final):,}")
+    print(f"Sample size for final model: {masks.count(final_sample):,}")
 
     # --- Run the final ECM ---
+    y_final, X_final = masks.design(dependent, exog_vars_final, final_sample)
     mod_final = PanelOLS(
-        df_reg_final[dependent],
-        df_reg_final[exog_vars_final],
+        y_final,
+        X_final,
         entity_effects=True
     )
     res_final = mod_final.fit(cov_type='driscoll-kraay', kernel='bartlett')
@@ -730,35 +722,35 @@ if 'level1_nace_en_name' in df_final.columns:
         .set_index('level1_nace_code')['level1_nace_en_name']
         .to_dict()
     )
-    # Add the descriptive name to our final regression dataframe
-    df_reg_final['sector_name'] = df_reg_final['level1_nace_code'].map(nace_level1_map)
+    # Add the descriptive name to the regression frame
+    df_pd['sector_name'] = df_pd['level1_nace_code'].map(nace_level1_map)
     grouping_col = 'sector_name'
 else:
     # Fallback to using the code if the name column wasn't carried through
     grouping_col = 'level1_nace_code'
 
 # Identify top sectors by observation count from the final regression sample
-top_sectors = df_reg_final[grouping_col].value_counts().head(7).index.to_list()
+top_sectors = masks.column(grouping_col, final_sample).value_counts().head(7).index.to_list()
 print(f"Analyzing top sectors by observation count: {top_sectors}")
 
 sectoral_results = []
 
 for sector in top_sectors:
-    df_sector = df_reg_final[df_reg_final[grouping_col] == sector]
+    sector_sample = final_sample & masks.equals(grouping_col, sector)
+    n_sector = masks.count(sector_sample)
     
-    if len(df_sector) > 1000:
-        print(f"\n--- Running Final ECM for Sector: {sector} (N={len(df_sector):,}) ---")
+    if n_sector > 1000:
+        print(f"\n--- Running Final ECM for Sector: {sector} (N={n_sector:,}) ---")
         
         mod_sector = PanelOLS(
-            df_sector[dependent],
-            df_sector[exog_vars_final],
+            *masks.design(dependent, exog_vars_final, sector_sample),
             entity_effects=True
         )
         res_sector = mod_sector.fit(cov_type='driscoll-kraay', kernel='bartlett')
         
         sectoral_results.append({
             "Sector": sector,
-            "Observations": len(df_sector),
+            "Observations": n_sector,
             "Energy Shock Coeff.": res_sector.params['energy_prices_inflation'],
             "p-value (Energy)": res_sector.pvalues['energy_prices_inflation']
         })
@@ -809,7 +801,7 @@ print("="*60)
 
 # First, calculate the average PPI growth for each sector during the 2021-2023 shock period
 shock_period_ppi = (
-    df_reg_final[df_reg_final.index.get_level_values('year').isin([2021, 2022, 2023])]
+    masks.take(['sector_name', 'sector_level1_ppi_by_nace_pct'], final_sample & masks.years_in([2021, 2022, 2023]))
     .groupby('sector_name')
     .agg({'sector_level1_ppi_by_nace_pct': 'mean'})
     .rename(columns={'sector_level1_ppi_by_nace_pct': 'Avg PPI Growth (21-23)'})
@@ -855,14 +847,13 @@ exog_vars_passthrough = exog_vars_final + ['sector_level1_ppi_by_nace_pct']
 passthrough_results = []
 
 for sector in top_sectors: # Using the same top sectors as before
-    df_sector = df_reg_final[df_reg_final[grouping_col] == sector].dropna(subset=exog_vars_passthrough)
+    sector_sample = final_sample & masks.equals(grouping_col, sector) & masks.complete(exog_vars_passthrough)
     
-    if len(df_sector) > 1000:
+    if masks.count(sector_sample) > 1000:
         print(f"\n--- Running Pass-Through Model for Sector: {sector} ---")
         
         mod_pt = PanelOLS(
-            df_sector[dependent],
-            df_sector[exog_vars_passthrough],
+            *masks.design(dependent, exog_vars_passthrough, sector_sample),
             entity_effects=True
         )
         res_pt = mod_pt.fit(cov_type='driscoll-kraay', kernel='bartlett')
@@ -921,7 +912,7 @@ if 'level2_nace_en_name' in df_final.columns:
         .set_index('level2_nace_code')['level2_nace_en_name']
         .to_dict()
     )
-    df_reg_final['sector_name_l2'] = df_reg_final['level2_nace_code'].map(nace_level2_map)
+    df_pd['sector_name_l2'] = df_pd['level2_nace_code'].map(nace_level2_map)
     grouping_col_l2 = 'sector_name_l2'
 else:
     grouping_col_l2 = 'level2_nace_code'
@@ -933,14 +924,13 @@ case_study_results = []
 
 for code, name in case_study_codes.items():
     # Use the code for filtering, name for display
-    df_sector = df_reg_final[df_reg_final['level2_nace_code'] == code].dropna(subset=exog_vars_passthrough_l2)
+    sector_sample = final_sample & masks.equals('level2_nace_code', code) & masks.complete(exog_vars_passthrough_l2)
     
-    if len(df_sector) > 1000:
+    if masks.count(sector_sample) > 1000:
         print(f"\n--- Running Pass-Through Model for Sector: {name} ({code}) ---")
         
         mod_cs = PanelOLS(
-            df_sector[dependent],
-            df_sector[exog_vars_passthrough_l2],
+            *masks.design(dependent, exog_vars_passthrough_l2, sector_sample),
             entity_effects=True
         )
         res_cs = mod_cs.fit(cov_type='driscoll-kraay', kernel='bartlett')
@@ -982,7 +972,7 @@ print("="*60)
 # --- CRITICAL FIX: Standardize NACE Level 2 codes ---
 # Ensure the code is a string and pad with a leading zero to ensure a length of 2.
 # This guarantees that '9' becomes '09' and matches correctly.
-df_reg_final['nace_l2_std'] = df_reg_final['level2_nace_code'].astype(str).str.zfill(2)
+df_pd['nace_l2_std'] = df_pd['level2_nace_code'].astype(str).str.zfill(2)
 
 
 # --- Define the CORRECTED and expanded set of NACE Level 2 codes ---
@@ -1009,14 +999,13 @@ case_study_results = []
 
 for code, name in case_study_codes.items():
     # Filter using the new, standardized NACE code
-    df_sector = df_reg_final[df_reg_final['nace_l2_std'] == code].dropna(subset=exog_vars_passthrough_l2)
+    sector_sample = final_sample & masks.equals('nace_l2_std', code) & masks.complete(exog_vars_passthrough_l2)
     
-    if len(df_sector) > 1000:
+    if masks.count(sector_sample) > 1000:
         print(f"\n--- Running Pass-Through Model for Sector: {name} ({code}) ---")
         
         mod_cs = PanelOLS(
-            df_sector[dependent],
-            df_sector[exog_vars_passthrough_l2],
+            *masks.design(dependent, exog_vars_passthrough_l2, sector_sample),
             entity_effects=True
         )
         res_cs = mod_cs.fit(cov_type='driscoll-kraay', kernel='bartlett')
@@ -1057,7 +1046,7 @@ MIN_OBS_FOR_SELECTION = 5000
 
 # Use pandas aggregation to get the observation count for each L2 sector
 sector_counts_df = (
-    df_reg_final
+    masks.take(['level2_nace_code', 'sector_level2_ppi_by_nace_pct'], final_sample)
     .groupby('level2_nace_code')
     .agg(
         obs_count=('sector_level2_ppi_by_nace_pct', 'size')
@@ -1081,13 +1070,13 @@ else:
     nace_level2_map = {code: code for code in sectors_to_run}
 
 for code in sectors_to_run:
-    df_sector = df_reg_final[df_reg_final['level2_nace_code'] == code].dropna(subset=exog_vars_passthrough_l2)
+    sector_sample = final_sample & masks.equals('level2_nace_code', code) & masks.complete(exog_vars_passthrough_l2)
     
-    if len(df_sector) >= MIN_OBS_FOR_SELECTION:
+    if masks.count(sector_sample) >= MIN_OBS_FOR_SELECTION:
         sector_name = nace_level2_map.get(code, code)
         print(f"\n--- Running Model for Sector: {sector_name} ({code}) ---")
         
-        mod_cs = PanelOLS(df_sector[dependent], df_sector[exog_vars_passthrough_l2], entity_effects=True)
+        mod_cs = PanelOLS(*masks.design(dependent, exog_vars_passthrough_l2, sector_sample), entity_effects=True)
         res_cs = mod_cs.fit(cov_type='driscoll-kraay', kernel='bartlett')
         
         case_study_results.append({
@@ -1123,7 +1112,7 @@ print("="*60)
 MIN_OBS_FOR_SELECTION = 5000
 
 sector_counts_df = (
-    df_reg_final
+    masks.take(['level2_nace_code', 'sector_level2_ppi_by_nace_pct'], final_sample)
     .groupby('level2_nace_code')
     .agg(
         obs_count=('sector_level2_ppi_by_nace_pct', 'size')
@@ -1145,13 +1134,13 @@ else:
     nace_level2_map = {code: code for code in sectors_to_run}
 
 for code in sectors_to_run:
-    df_sector = df_reg_final[df_reg_final['level2_nace_code'] == code].dropna(subset=exog_vars_passthrough_l2)
+    sector_sample = final_sample & masks.equals('level2_nace_code', code) & masks.complete(exog_vars_passthrough_l2)
     
-    if len(df_sector) >= MIN_OBS_FOR_SELECTION:
+    if masks.count(sector_sample) >= MIN_OBS_FOR_SELECTION:
         sector_name = nace_level2_map.get(code, code)
         print(f"\n--- Running Model for Sector: {sector_name} ({code}) ---")
         
-        mod_cs = PanelOLS(df_sector[dependent], df_sector[exog_vars_passthrough_l2], entity_effects=True)
+        mod_cs = PanelOLS(*masks.design(dependent, exog_vars_passthrough_l2, sector_sample), entity_effects=True)
         res_cs = mod_cs.fit(cov_type='driscoll-kraay', kernel='bartlett')
         
         case_study_results.append({
@@ -1273,11 +1262,11 @@ print("="*60)
 # --- 1. Re-running the Final, Fully-Specified Model ---
 print("\n--- Final Model with Two-Way Clustering ---")
 
-if 'df_reg_final' in locals():
+if 'final_sample' in locals():
     # Rerun the final model, changing only the cov_type
     mod_final_tw = PanelOLS(
-        df_reg_final[dependent],
-        df_reg_final[exog_vars_final],
+        y_final,
+        X_final,
         entity_effects=True
     )
     res_final_tw = mod_final_tw.fit(
@@ -1298,10 +1287,10 @@ else:
 # --- 2. Re-running the Interaction Model ---
 print("\n--- Interaction Model with Two-Way Clustering ---")
 
-if 'df_interaction' in locals():
+if 'X_interaction' in locals():
     mod_interaction_tw = PanelOLS(
-        df_interaction[dependent],
-        df_interaction[exog_vars_interaction],
+        y_dynamic,
+        X_interaction[exog_vars_interaction],
         entity_effects=True
     )
     res_interaction_tw = mod_interaction_tw.fit(
@@ -1330,13 +1319,13 @@ print("\n--- NACE L2 Case Study with Two-Way Clustering ---")
 if 'sectors_to_run' in locals():
     tw_cluster_results = []
     for code in sectors_to_run:
-        df_sector = df_reg_final[df_reg_final['level2_nace_code'] == code].dropna(subset=exog_vars_passthrough_l2)
+        sector_sample = final_sample & masks.equals('level2_nace_code', code) & masks.complete(exog_vars_passthrough_l2)
 
-        if len(df_sector) >= MIN_OBS_FOR_SELECTION:
+        if masks.count(sector_sample) >= MIN_OBS_FOR_SELECTION:
             sector_name = nace_level2_map.get(code, code)
             print(f"\n--- Running Two-Way Cluster Model for Sector: {sector_name} ({code}) ---")
             
-            mod_cs_tw = PanelOLS(df_sector[dependent], df_sector[exog_vars_passthrough_l2], entity_effects=True)
+            mod_cs_tw = PanelOLS(*masks.design(dependent, exog_vars_passthrough_l2, sector_sample), entity_effects=True)
             res_cs_tw = mod_cs_tw.fit(
                 cov_type='clustered',
                 cluster_entity=True,
@@ -1373,8 +1362,10 @@ print("RUNNING ENDOGENOUS STRUCTURAL BREAK TEST (SUP-F) - FINAL CORRECTED")
 print("="*60)
 
 # --- Step 1: Define the sample and trimming period ---
-df_break_test = df_reg.sort_index(level='year')
-years = df_break_test.index.get_level_values('year').unique().sort_values()
+# The regression sample is complete on every model variable (and hence on the
+# interaction term), so both models of every candidate year share one design matrix
+y_break, X_break = y_dynamic, X_dynamic
+years = masks.years_present(reg_sample)
 
 trim_frac = 0.15
 start_year = years[int(len(years) * trim_frac)]
@@ -1391,20 +1382,16 @@ exog_vars_restricted = exog_vars_dynamic
 for break_year in potential_break_years:
     print(f"  - Testing for break in year {break_year}...")
     
-    df_temp = df_break_test.copy()
-    
-    df_temp['post_break'] = (df_temp.index.get_level_values('year') > break_year).astype(int)
-    df_temp['inflation_x_break'] = df_temp['inflation_rate'] * df_temp['post_break']
+    post_break = (X_break.index.get_level_values('year') > break_year).astype(int)
+    X_unrestricted = X_break.assign(inflation_x_break=X_break['inflation_rate'] * post_break)
     exog_vars_unrestricted = exog_vars_dynamic + ['inflation_x_break']
     
-    df_loop_sample = df_temp.dropna(subset=exog_vars_unrestricted)
-    
     # Fit the UNRESTRICTED model
-    mod_unrestricted = PanelOLS(df_loop_sample[dependent], df_loop_sample[exog_vars_unrestricted], entity_effects=True)
+    mod_unrestricted = PanelOLS(y_break, X_unrestricted[exog_vars_unrestricted], entity_effects=True)
     res_unrestricted = mod_unrestricted.fit(cov_type='clustered', cluster_entity=True, cluster_time=True)
     
     # Fit the RESTRICTED model on the SAME sample
-    mod_restricted = PanelOLS(df_loop_sample[dependent], df_loop_sample[exog_vars_restricted], entity_effects=True)
+    mod_restricted = PanelOLS(y_break, X_break[exog_vars_restricted], entity_effects=True)
     res_restricted = mod_restricted.fit(cov_type='clustered', cluster_entity=True, cluster_time=True)
     
     # Manually calculate the F-statistic
@@ -1463,8 +1450,9 @@ print("="*60)
 # --- Step 1: Define the FOCUSED sample and trimming period ---
 # We restrict the analysis to the more recent economic regime
 FOCUS_START_YEAR = 2012
-df_break_test_focused = df_reg[df_reg.index.get_level_values('year') >= FOCUS_START_YEAR].sort_index(level='year')
-years_focused = df_break_test_focused.index.get_level_values('year').unique().sort_values()
+focused_sample = reg_sample & masks.period(start=FOCUS_START_YEAR)
+y_focused, X_focused = masks.design(dependent, exog_vars_dynamic, focused_sample)
+years_focused = masks.years_present(focused_sample)
 
 # Standard 15% trimming on the NEW, shorter sample
 trim_frac_focused = 0.15
@@ -1482,18 +1470,14 @@ exog_vars_restricted = exog_vars_dynamic
 for break_year in potential_break_years_focused:
     print(f"  - Testing for break in year {break_year}...")
     
-    df_temp = df_break_test_focused.copy()
-    
-    df_temp['post_break'] = (df_temp.index.get_level_values('year') > break_year).astype(int)
-    df_temp['inflation_x_break'] = df_temp['inflation_rate'] * df_temp['post_break']
+    post_break = (X_focused.index.get_level_values('year') > break_year).astype(int)
+    X_unrestricted = X_focused.assign(inflation_x_break=X_focused['inflation_rate'] * post_break)
     exog_vars_unrestricted = exog_vars_dynamic + ['inflation_x_break']
     
-    df_loop_sample = df_temp.dropna(subset=exog_vars_unrestricted)
-    
-    mod_unrestricted = PanelOLS(df_loop_sample[dependent], df_loop_sample[exog_vars_unrestricted], entity_effects=True)
+    mod_unrestricted = PanelOLS(y_focused, X_unrestricted[exog_vars_unrestricted], entity_effects=True)
     res_unrestricted = mod_unrestricted.fit(cov_type='clustered', cluster_entity=True, cluster_time=True)
     
-    mod_restricted = PanelOLS(df_loop_sample[dependent], df_loop_sample[exog_vars_restricted], entity_effects=True)
+    mod_restricted = PanelOLS(y_focused, X_focused[exog_vars_restricted], entity_effects=True)
     res_restricted = mod_restricted.fit(cov_type='clustered', cluster_entity=True, cluster_time=True)
     
     ssr_u = res_unrestricted.resid_ss
@@ -1596,7 +1580,7 @@ print("ESTIMATING THE TIME-SERIES VAR MODEL (CORRECTED)")
 print("="*60)
 
 # --- Prepare the data for the VAR model ---
-macro_ts = df_reg_final[['inflation_rate', 'unit_labor_cost', 'output_gap']].groupby('year').mean()
+macro_ts = masks.take(['inflation_rate', 'unit_labor_cost', 'output_gap'], final_sample).groupby('year').mean()
 var_data = aggregate_margin_ts.join(macro_ts).dropna()
 
 print("Final time-series data for VAR model:")
@@ -9,35 +9,43 @@ import polars as pl
 from linearmodels.panel import PanelOLS
 import statsmodels.api as sm
 import warnings
+import os
+import sys
+
+sys.path.append(os.path.abspath(".."))
+from utils.catalog import VARIABLE_SETS, scan_variables
+from utils.dev_mode import dev_input, load_dev_mode
+from utils.panel_lag import year_lag
 
 warnings.filterwarnings('ignore')
 
 # --- Configuration ---
-DATA_PATH = "../data/data_ready/merged_panel_winsorized.parquet"
+DEV_MODE = load_dev_mode()  # sampled firms only in dev mode (utils/dev_mode.py)
+DATA_PATH = dev_input("../data/data_ready/merged_panel_winsorized.parquet", DEV_MODE)
 FIRM_ID_COL = "firm_ico"
 MIN_OBS_PER_SECTOR = 1000
 
 # --- 1. Data Preparation ---
 print("--- Preparing data for robustness check ---")
 
-# Load and set up the panel index
-df = pl.read_parquet(DATA_PATH).to_pandas().set_index([FIRM_ID_COL, 'year'])
-
 # Define core variables for the reverse-direction model
 dependent = 'sector_level2_ppi_by_nace_pct'
 key_independent = 'firm_operating_margin_cal'
 
-# Create lagged dependent for dynamics
-df['l_sector_ppi'] = df.groupby(level=FIRM_ID_COL)[dependent].shift(1)
+# Load only the model variables and the macro controls (see utils/catalog.py),
+# with the lagged dependent for dynamics (previous year of the firm, null across gaps)
+df = (
+    scan_variables(DATA_PATH, dependent, key_independent, "macro_controls", strict=False)
+    .sort(FIRM_ID_COL, 'year')
+    .with_columns(year_lag(dependent, group=FIRM_ID_COL).alias('l_sector_ppi'))
+    .collect()
+    .to_pandas()
+    .set_index([FIRM_ID_COL, 'year'])
+)
 
 # List of ALL plausible macro controls to iterate through from your inventory
-# We use the raw _dpp or _pct versions
-potential_controls = [
-    'mac_ULC_pct', 'mac_hicp_pure_energy_roc', 'mac_fx_czk_eur_annual_avg_pct',
-    'mac_GAP_dpp', 'mac_NLGXQ_dpp', 'mac_RPMGS_pct', 'mac_UNR_dpp',
-    'mac_PDTY_pct', 'mac_TTRADE_pct', 'mac_CPV_ANNPCT', 'mac_ITV_ANNPCT',
-    'mac_cnb_repo_rate_annual_dpp'
-]
+# We use the raw _dpp or _pct versions (catalog set "macro_controls")
+potential_controls = [c for c in VARIABLE_SETS["macro_controls"] if c in df.columns]
 
 # Base model includes the key independent variable and dynamics
 base_exog = [key_independent, 'l_sector_ppi']
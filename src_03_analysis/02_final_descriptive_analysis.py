@@ -22,13 +22,20 @@ import seaborn as sns
 from pathlib import Path
 import statsmodels.api as sm
 import warnings
+import os
 import sys
 
+sys.path.append(os.path.abspath(".."))
+from utils.catalog import VARIABLE_SETS, scan_variables
+from utils.dev_mode import dev_input, dev_output, load_dev_mode
+
 warnings.filterwarnings('ignore')
 
 # --- Paths and Styling ---
-DATA_PATH = Path("../data/data_ready/merged_panel_winsorized.parquet") 
-PLOTS_PATH = Path("../plots/")
+# Dev mode (utils/dev_mode.py): sampled firms only, paths under dev/<namespace>/
+DEV_MODE = load_dev_mode()
+DATA_PATH = dev_input(Path("../data/data_ready/merged_panel_winsorized.parquet"), DEV_MODE)
+PLOTS_PATH = dev_output(Path("../plots/"), DEV_MODE)
 
 
 PLOTS_PATH.mkdir(exist_ok=True) 
@@ -68,7 +75,10 @@ if not DATA_PATH.is_file():
     sys.exit("Execution stopped due to missing data file.") 
 else:
     # --- Load and Process Data ---
-    df = pl.read_parquet(DATA_PATH)
+    # Only the margin, the sector names and the macro levels are used below
+    df = scan_variables(
+        str(DATA_PATH), "firm_operating_margin_cal", "level1_nace_en_name", "macro_levels"
+    ).collect()
 
     # Aggregate firm-level data to get median operating margin per year
     agg_margins = df.group_by("year").agg(
@@ -158,15 +168,7 @@ plt.show()
 
 # %%
 # === Generate and Save Plot 3 ===
-macro_vars = [
-    'mac_hicp_overall_roc',
-    'mac_hicp_pure_energy_roc',
-    'mac_cnb_repo_rate_annual',
-    'mac_GAP',
-    'mac_NLGXQ',
-    'mac_ULC',
-    'mac_RPMGS'
-]
+macro_vars = VARIABLE_SETS["macro_levels"]
 
 # Extract unique macro data per year
 macro_df = df.select(macro_vars + ['year']).unique().sort('year').to_pandas()
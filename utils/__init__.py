@@ -0,0 +1 @@
+"""Shared Polars helpers used by the data-quality, merge and analysis stages."""
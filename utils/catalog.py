@@ -0,0 +1,140 @@
+"""
+Column projection catalog for the merged panel.
+
+Analysis scripts declare the variable sets they need instead of reading the
+whole panel. A set is resolved from, in order:
+
+- a named set in `VARIABLE_SETS` (e.g. ``"ecm_core"``, ``"macro_shocks"``);
+- ``"category:<text>"``, every variable of the `specs/data_inventory.json`
+  category whose name contains <text> (case-insensitive);
+- a single column name.
+
+`scan_variables` returns a lazy frame projected to the panel keys plus the
+resolved columns, so load time and memory scale with the columns used and not
+with the width of the file. Star-schema directories (see `utils.star_schema`)
+are supported: only the dimensions that provide a requested column are joined.
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import polars as pl
+
+INVENTORY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "specs", "data_inventory.json"
+)
+PANEL_KEYS = ["firm_ico", "year"]
+CATEGORY_PREFIX = "category:"
+
+VARIABLE_SETS: Dict[str, List[str]] = {
+    # firm-level inputs of the margin error-correction models (01_panel.py)
+    "ecm_core": [
+        "firm_operating_margin_cal", "firm_sales_revenue", "firm_equity",
+        "firm_total_liabilities_and_equity", "firm_year_founded",
+    ],
+    # theory-guided macro shocks
+    "macro_shocks": [
+        "mac_hicp_overall_roc", "mac_hicp_pure_energy_roc", "mac_cnb_repo_rate_annual",
+        "mac_ULC_pct", "mac_RPMGS_pct", "mac_fx_czk_eur_annual_avg_pct",
+    ],
+    # macro controls of the robustness specification search
+    "macro_controls": [
+        "mac_ULC_pct", "mac_hicp_pure_energy_roc", "mac_fx_czk_eur_annual_avg_pct",
+        "mac_GAP_dpp", "mac_NLGXQ_dpp", "mac_RPMGS_pct", "mac_UNR_dpp",
+        "mac_PDTY_pct", "mac_TTRADE_pct", "mac_CPV_ANNPCT", "mac_ITV_ANNPCT",
+        "mac_cnb_repo_rate_annual_dpp",
+    ],
+    # macro levels shown in the descriptive correlation heatmap
+    "macro_levels": [
+        "mac_hicp_overall_roc", "mac_hicp_pure_energy_roc", "mac_cnb_repo_rate_annual",
+        "mac_GAP", "mac_NLGXQ", "mac_ULC", "mac_RPMGS",
+    ],
+    # sectoral producer price inflation
+    "sector_ppi": ["sector_level1_ppi_by_nace_pct", "sector_level2_ppi_by_nace_pct"],
+    # sector identifiers and names
+    "sector_ids": ["level1_nace_code", "level1_nace_en_name", "level2_nace_code", "level2_nace_en_name"],
+}
+
+
+@lru_cache(maxsize=None)
+def load_inventory(path: str = INVENTORY_PATH) -> Dict[str, Dict]:
+    """Map each documented variable to its inventory entry (plus `category`)."""
+    with open(path, encoding="utf-8") as f:
+        inventory = json.load(f)
+    variables = {}
+    for category in inventory["categories"]:
+        for var in category["variables"]:
+            variables.setdefault(var["name"], {**var, "category": category["category_name"]})
+    return variables
+
+
+def category_variables(text: str, path: str = INVENTORY_PATH) -> List[str]:
+    """Variables of the single inventory category whose name contains `text`."""
+    inventory = load_inventory(path)
+    categories = sorted({v["category"] for v in inventory.values() if text.lower() in v["category"].lower()})
+    if len(categories) != 1:
+        raise KeyError(f"'{text}' matches {len(categories)} inventory categories: {categories}")
+    return [name for name, v in inventory.items() if v["category"] == categories[0]]
+
+
+def resolve(*specs: str, path: str = INVENTORY_PATH) -> List[str]:
+    """Expand set names, inventory categories and column names, without duplicates."""
+    columns: List[str] = []
+    for spec in specs:
+        if spec in VARIABLE_SETS:
+            names = VARIABLE_SETS[spec]
+        elif spec.startswith(CATEGORY_PREFIX):
+            names = category_variables(spec[len(CATEGORY_PREFIX):], path)
+        else:
+            names = [spec]
+        columns.extend(n for n in names if n not in columns)
+    return columns
+
+
+def _scan(source: str, columns: Optional[List[str]] = None) -> pl.LazyFrame:
+    if os.path.isdir(source):
+        from utils.star_schema import scan_star
+        return scan_star(source, columns)
+    lf = pl.scan_parquet(source)
+    return lf if columns is None else lf.select(columns)
+
+
+def scan_variables(
+    source: str,
+    *specs: str,
+    keys: List[str] = PANEL_KEYS,
+    strict: bool = True,
+) -> pl.LazyFrame:
+    """
+    Lazily load only `keys` and the columns resolved from `specs`.
+
+    `source` is a Parquet file or a star-schema directory. With `strict`,
+    a requested column that is not in the file raises KeyError; otherwise it
+    is skipped and reported.
+    """
+    wanted = resolve(*keys, *specs)
+    available = set(_scan(source).collect_schema().names())
+    missing = [c for c in wanted if c not in available]
+    if missing and strict:
+        raise KeyError(f"Columns not found in {source}: {missing}")
+    if missing:
+        print(f"Catalog: skipping {len(missing)} column(s) not in {source}: {missing}")
+    return _scan(source, [c for c in wanted if c in available])
+
+
+def describe(*specs: str, path: str = INVENTORY_PATH) -> pl.DataFrame:
+    """Inventory documentation (category, description, unit, source) of the resolved columns."""
+    inventory = load_inventory(path)
+    rows = []
+    for name in resolve(*specs, path=path):
+        entry = inventory.get(name, {})
+        rows.append({
+            "name": name,
+            "category": entry.get("category"),
+            "description": entry.get("description"),
+            "unit": entry.get("unit"),
+            "source": entry.get("source"),
+        })
+    return pl.DataFrame(rows, schema={k: pl.String for k in ("name", "category", "description", "unit", "source")})
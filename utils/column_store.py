@@ -0,0 +1,239 @@
+"""
+Column-level content-addressed store for panel variants.
+
+The imputed, hq and winsorized panels share most of their columns unchanged.
+Instead of one complete Parquet file per variant, the store keeps every column
+chunk (one column over up to `CHUNK_ROWS` rows) once, as an uncompressed Arrow
+IPC file named by the SHA-256 of its bytes, and describes each variant by a
+JSON manifest listing the chunk hashes of its columns:
+
+    <store>/chunks/<hh>/<sha256>.arrow
+    <store>/variants/<name>.json
+
+Rows are put in a canonical order (`firm_ico`, `year`) before chunking, so a
+column that is equal in two variants maps to the same chunks and costs no
+extra disk; adding a variant writes only the chunks not yet in the store.
+`derive_variant` builds a variant from an existing one plus replaced or added
+columns without touching the other columns at all. Reading memory-maps the
+chunk files, so `open_variant` is zero-copy and the Polars frame returned by
+`read_variant` shares the buffers of fixed-width columns.
+
+CLI::
+
+    python utils/column_store.py put   <store> <name> <panel.parquet | star_dir>
+    python utils/column_store.py stats <store>
+"""
+
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Sequence, Union
+
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+CHUNK_ROWS = 1 << 20
+SORT_KEYS = ["firm_ico", "year"]
+CHUNK_FIELD = "values"
+
+
+def _chunk_path(store: str, digest: str) -> str:
+    return os.path.join(store, "chunks", digest[:2], f"{digest}.arrow")
+
+
+def _manifest_path(store: str, name: str) -> str:
+    return os.path.join(store, "variants", f"{name}.json")
+
+
+def _serialize(array) -> bytes:
+    import pyarrow as pa
+
+    table = pa.table({CHUNK_FIELD: array})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _put_chunk(store: str, array) -> str:
+    """Store one column chunk unless an identical one exists; return its hash."""
+    payload = _serialize(array)
+    digest = hashlib.sha256(payload).hexdigest()
+    path = _chunk_path(store, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    return digest
+
+
+def _column_entry(store: str, series: pl.Series, chunk_rows: int) -> Dict:
+    array = series.to_arrow()
+    chunks = [_put_chunk(store, array.slice(start, chunk_rows)) for start in range(0, max(len(array), 1), chunk_rows)]
+    return {"name": series.name, "dtype": str(series.dtype), "chunks": chunks}
+
+
+def _save_manifest(store: str, manifest: Dict) -> None:
+    path = _manifest_path(store, manifest["name"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def load_manifest(store: str, name: str) -> Dict:
+    path = _manifest_path(store, name)
+    if not os.path.exists(path):
+        raise KeyError(f"Variant '{name}' not found in {store}")
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_variants(store: str) -> List[str]:
+    folder = os.path.join(store, "variants")
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(folder) if name.endswith(".json"))
+
+
+def put_variant(
+    store: str,
+    name: str,
+    panel: Frame,
+    sort_by: Optional[Sequence[str]] = SORT_KEYS,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Dict:
+    """
+    Add (or replace) variant `name`. The panel is sorted by `sort_by` (when
+    those columns exist) so equal columns of different variants share chunks;
+    only chunks missing from the store are written.
+    """
+    df = panel.lazy().collect() if isinstance(panel, pl.LazyFrame) else panel
+    if sort_by and all(c in df.columns for c in sort_by):
+        df = df.sort(list(sort_by))
+    manifest = {
+        "name": name,
+        "rows": df.height,
+        "chunk_rows": chunk_rows,
+        "sort_by": list(sort_by or []),
+        "columns": [_column_entry(store, df.get_column(c), chunk_rows) for c in df.columns],
+    }
+    _save_manifest(store, manifest)
+    return manifest
+
+
+def derive_variant(
+    store: str,
+    name: str,
+    base: str,
+    columns: Optional[Frame] = None,
+    drop: Sequence[str] = (),
+) -> Dict:
+    """
+    New variant `name` = variant `base` with `columns` replaced or appended
+    and `drop` removed. `columns` must be row-aligned with `base` (same height,
+    in the base's row order); only its columns are serialized and written.
+    """
+    manifest = load_manifest(store, base)
+    updates = (columns.lazy().collect() if isinstance(columns, pl.LazyFrame) else columns) if columns is not None else pl.DataFrame()
+    if updates.width and updates.height != manifest["rows"]:
+        raise ValueError(f"Derived columns have {updates.height:,} rows, variant '{base}' has {manifest['rows']:,}")
+
+    entries = {c["name"]: c for c in manifest["columns"] if c["name"] not in drop}
+    for col in updates.columns:
+        entries[col] = _column_entry(store, updates.get_column(col), manifest["chunk_rows"])
+    order = [c["name"] for c in manifest["columns"] if c["name"] in entries]
+    order += [c for c in updates.columns if c not in order]
+    derived = {**manifest, "name": name, "base": base, "columns": [entries[c] for c in order]}
+    _save_manifest(store, derived)
+    return derived
+
+
+def open_variant(store: str, name: str, columns: Optional[List[str]] = None):
+    """Variant as a `pyarrow.Table` whose buffers are memory-mapped chunk files."""
+    import pyarrow as pa
+
+    manifest = load_manifest(store, name)
+    entries = {c["name"]: c for c in manifest["columns"]}
+    wanted = columns if columns is not None else list(entries)
+    missing = [c for c in wanted if c not in entries]
+    if missing:
+        raise KeyError(f"Columns not found in variant '{name}': {missing}")
+
+    arrays = []
+    for col in wanted:
+        pieces = []
+        for digest in entries[col]["chunks"]:
+            with pa.memory_map(_chunk_path(store, digest)) as source:
+                pieces.extend(pa.ipc.open_file(source).read_all().column(CHUNK_FIELD).chunks)
+        arrays.append(pa.chunked_array(pieces))
+    return pa.Table.from_arrays(arrays, names=wanted)
+
+
+def read_variant(store: str, name: str, columns: Optional[List[str]] = None) -> pl.DataFrame:
+    """Variant as a Polars frame (no rechunking, so shared buffers are not copied)."""
+    return pl.from_arrow(open_variant(store, name, columns), rechunk=False)
+
+
+def store_usage(store: str) -> pl.DataFrame:
+    """
+    Per variant: columns, distinct chunks, logical size (all its chunks) and
+    exclusive size (chunks no other variant references); the `_store` row is
+    the physical total (distinct column names and chunks of the store).
+    """
+    manifests = [load_manifest(store, v) for v in list_variants(store)]
+    refs: Dict[str, set] = {}
+    for m in manifests:
+        for entry in m["columns"]:
+            for digest in entry["chunks"]:
+                refs.setdefault(digest, set()).add(m["name"])
+    size = {d: os.path.getsize(_chunk_path(store, d)) for d in refs}
+
+    rows = []
+    for m in manifests:
+        digests = {d for entry in m["columns"] for d in entry["chunks"]}
+        rows.append({
+            "variant": m["name"],
+            "columns": len(m["columns"]),
+            "chunks": len(digests),
+            "logical_mb": sum(size[d] for d in digests) / 1e6,
+            "exclusive_mb": sum(size[d] for d in digests if refs[d] == {m["name"]}) / 1e6,
+        })
+    column_names = {entry["name"] for m in manifests for entry in m["columns"]}
+    rows.append({"variant": "_store", "columns": len(column_names), "chunks": len(refs),
+                 "logical_mb": sum(size.values()) / 1e6, "exclusive_mb": sum(size.values()) / 1e6})
+    return pl.DataFrame(rows)
+
+
+def remove_variant(store: str, name: str) -> int:
+    """Delete a variant's manifest and the chunks no other variant uses; return the number removed."""
+    os.remove(_manifest_path(store, name))
+    referenced = {d for v in list_variants(store) for entry in load_manifest(store, v)["columns"] for d in entry["chunks"]}
+    removed = 0
+    chunk_root = os.path.join(store, "chunks")
+    for folder, _, files in os.walk(chunk_root):
+        for file in files:
+            if file.endswith(".arrow") and file[:-len(".arrow")] not in referenced:
+                os.remove(os.path.join(folder, file))
+                removed += 1
+    return removed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("put", "stats") or (sys.argv[1] == "put" and len(sys.argv) != 5):
+        print("Usage: python utils/column_store.py put <store> <name> <panel.parquet | star_dir>")
+        print("       python utils/column_store.py stats <store>")
+        sys.exit(1)
+    if sys.argv[1] == "put":
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from utils.star_schema import scan_star
+
+        store_dir, variant, source = sys.argv[2:5]
+        panel = scan_star(source) if os.path.isdir(source) else pl.scan_parquet(source)
+        put_variant(store_dir, variant, panel)
+        print(f"Variant '{variant}' stored in {store_dir}")
+    with pl.Config(tbl_rows=-1):
+        print(store_usage(sys.argv[2]))
@@ -0,0 +1,194 @@
+"""
+Hash-based firm-period deduplication for concatenated MagnusWeb exports.
+
+Each record receives a 64-bit hash of its key (IČO, year, quarter) and a hash
+of its content (all remaining columns). Records sharing key and content hash
+are exact duplicates and collapse to one row; records sharing a key with
+different content are conflicts and are resolved by a precedence rule:
+
+- ``latest_export``: keep the record from the most recent export;
+- ``most_complete``: keep the record with the most non-null fields
+  (ties broken by the most recent export).
+
+All comparisons are on native Polars hashes, never on pandas objects. To bound
+memory, the exports are read and hashed once and the hashed rows are spilled
+to `n_partitions` Parquet partitions by key hash; each partition is then read
+once, resolved and checked for conflicts in memory, so peak memory is bounded
+by the largest partition.
+"""
+
+import glob
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+import polars as pl
+
+KEY_HASH_COL = "__key_hash"
+ROW_HASH_COL = "__row_hash"
+PRIORITY_COL = "__priority"
+PARTITION_COL = "__partition"
+EXPORT_RANK_COL = "export_rank"
+HASH_SEED = 20250716
+
+PRECEDENCE_LATEST = "latest_export"
+PRECEDENCE_COMPLETE = "most_complete"
+PRECEDENCE_RULES = (PRECEDENCE_LATEST, PRECEDENCE_COMPLETE)
+
+
+def scan_exports(paths: List[str], rank_col: str = EXPORT_RANK_COL, **scan_kwargs) -> pl.LazyFrame:
+    """
+    Lazily concatenate export files, tagging each row with the file's rank.
+
+    Rank follows the order of `paths` (pass them sorted, oldest first), so a
+    higher rank means a more recent export.
+    """
+    frames = [
+        pl.scan_csv(path, **scan_kwargs).with_columns(pl.lit(rank, pl.UInt32).alias(rank_col))
+        for rank, path in enumerate(paths)
+    ]
+    return pl.concat(frames, how="diagonal")
+
+
+def add_hashes(
+    lf: pl.LazyFrame,
+    key_cols: List[str],
+    source_col: str = EXPORT_RANK_COL,
+    value_cols: Optional[List[str]] = None,
+) -> pl.LazyFrame:
+    """Attach the key hash and the content hash (all columns except keys and source)."""
+    if value_cols is None:
+        value_cols = [c for c in lf.collect_schema().names() if c not in key_cols and c != source_col]
+    return lf.with_columns(
+        pl.struct(key_cols).hash(HASH_SEED).alias(KEY_HASH_COL),
+        pl.struct(value_cols).hash(HASH_SEED).alias(ROW_HASH_COL),
+    )
+
+
+def _priority(source_col: str, value_cols: List[str], precedence: str) -> pl.Expr:
+    """Sortable priority: larger wins. Content hash is the final tie-breaker."""
+    source = pl.col(source_col).cast(pl.UInt64)
+    if precedence == PRECEDENCE_LATEST:
+        return pl.struct(source.alias("source"), pl.col(ROW_HASH_COL).alias("row"))
+    if precedence == PRECEDENCE_COMPLETE:
+        completeness = pl.sum_horizontal([pl.col(c).is_not_null() for c in value_cols]).cast(pl.UInt32)
+        return pl.struct(completeness.alias("filled"), source.alias("source"), pl.col(ROW_HASH_COL).alias("row"))
+    raise ValueError(f"Unknown precedence rule '{precedence}' (use one of {PRECEDENCE_RULES})")
+
+
+def _spill(hashed: pl.LazyFrame, n_partitions: int, spill_dir: str) -> List[Tuple[int, str]]:
+    """
+    Stream the hashed rows once into one directory per key-hash partition and
+    return (partition, directory) of the non-empty partitions.
+    """
+    hashed.sink_parquet(
+        pl.PartitionBy(
+            spill_dir,
+            key={PARTITION_COL: pl.col(KEY_HASH_COL) % n_partitions},
+            include_key=False,
+            approximate_bytes_per_file=None,
+        )
+    )
+    parts = [(part, os.path.join(spill_dir, f"{PARTITION_COL}={part}")) for part in range(n_partitions)]
+    return [(part, path) for part, path in parts if os.path.isdir(path)]
+
+
+def _resolve(part: pl.DataFrame, key_cols: List[str], source_col: str, value_cols: List[str], precedence: str) -> pl.DataFrame:
+    """Keep exactly one record per key: the one with the highest priority."""
+    return (
+        part.with_columns(_priority(source_col, value_cols, precedence).alias(PRIORITY_COL))
+        .sort(PRIORITY_COL, descending=True)
+        .unique(subset=key_cols, keep="first")
+        .drop([KEY_HASH_COL, ROW_HASH_COL, PRIORITY_COL])
+    )
+
+
+def _conflicts(part: pl.DataFrame, key_cols: List[str], source_col: str, value_cols: List[str], precedence: str) -> pl.DataFrame:
+    """One row per key whose records disagree in content."""
+    priority = _priority(source_col, value_cols, precedence)
+    return (
+        part.group_by(key_cols)
+        .agg(
+            pl.len().alias("n_records"),
+            pl.col(ROW_HASH_COL).n_unique().alias("n_versions"),
+            pl.col(source_col).unique().sort().alias("sources"),
+            pl.col(source_col).sort_by(priority).last().alias("kept_source"),
+        )
+        .filter(pl.col("n_versions") > 1)
+    )
+
+
+def duplicate_summary(
+    lf: pl.LazyFrame,
+    key_cols: List[str],
+    source_col: str = EXPORT_RANK_COL,
+    value_cols: Optional[List[str]] = None,
+) -> dict:
+    """
+    Count rows, exact duplicates, duplicated keys and conflicting keys in one
+    aggregation over the key/content hashes.
+    """
+    per_key = (
+        add_hashes(lf, key_cols, source_col, value_cols)
+        .group_by(key_cols)
+        .agg(pl.len().alias("n"), pl.col(ROW_HASH_COL).n_unique().alias("versions"))
+    )
+    summary = per_key.select(
+        pl.col("n").sum().alias("rows"),
+        pl.len().alias("unique_keys"),
+        (pl.col("n") - pl.col("versions")).sum().alias("exact_duplicate_rows"),
+        (pl.col("n") > 1).sum().alias("duplicated_keys"),
+        (pl.col("versions") > 1).sum().alias("conflicting_keys"),
+    ).collect(engine="streaming")
+    return summary.row(0, named=True)
+
+
+def deduplicate(
+    lf: pl.LazyFrame,
+    key_cols: List[str],
+    source_col: str = EXPORT_RANK_COL,
+    precedence: str = PRECEDENCE_LATEST,
+    value_cols: Optional[List[str]] = None,
+    n_partitions: int = 1,
+    out_dir: Optional[str] = None,
+) -> Tuple[Optional[pl.DataFrame], pl.DataFrame]:
+    """
+    Resolve exact and conflicting duplicates per key.
+
+    Returns `(deduplicated, conflict_report)`. The exports are scanned and
+    hashed once; the hashed rows are spilled to a temporary directory (inside
+    `out_dir` when given) in `n_partitions` key-hash partitions, and each
+    partition is read once to resolve its keys and report its conflicts.
+    When `out_dir` is given, partition `i` is written to
+    `out_dir/part-000i.parquet` (empty partitions are not written) and the
+    first element is None, so peak memory is bounded by the largest partition
+    rather than the whole export set.
+    """
+    if precedence not in PRECEDENCE_RULES:
+        raise ValueError(f"Unknown precedence rule '{precedence}' (use one of {PRECEDENCE_RULES})")
+    if value_cols is None:
+        value_cols = [c for c in lf.collect_schema().names() if c not in key_cols and c != source_col]
+
+    hashed = add_hashes(lf, key_cols, source_col, value_cols)
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(out_dir, "part-*.parquet")):
+            os.remove(stale)
+
+    resolved, reports = [], []
+    with tempfile.TemporaryDirectory(prefix="dedup-spill-", dir=out_dir) as spill_dir:
+        for part, part_dir in _spill(hashed, n_partitions, spill_dir):
+            part_df = pl.read_parquet(os.path.join(part_dir, "*.parquet"))
+            kept = _resolve(part_df, key_cols, source_col, value_cols, precedence)
+            if out_dir is not None:
+                kept.write_parquet(os.path.join(out_dir, f"part-{part:04d}.parquet"))
+            else:
+                resolved.append(kept)
+            reports.append(_conflicts(part_df, key_cols, source_col, value_cols, precedence))
+    if not reports:  # no rows at all
+        empty = hashed.head(0).collect()
+        resolved = [] if out_dir is not None else [_resolve(empty, key_cols, source_col, value_cols, precedence)]
+        reports = [_conflicts(empty, key_cols, source_col, value_cols, precedence)]
+
+    deduplicated = pl.concat(resolved) if resolved else None
+    return deduplicated, pl.concat(reports).sort(key_cols)
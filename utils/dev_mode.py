@@ -0,0 +1,186 @@
+"""
+Deterministic firm subsampling ("dev mode") across all pipeline stages.
+
+With dev mode on, every stage keeps the same fraction of firms, from the raw
+exports through DQ, merge and growth to the analysis scripts. A firm is kept
+when the hash of its canonical IČO (surrounding whitespace and leading zeros
+removed, so ``"00012345"``, ``"12345"`` and ``12345`` agree) falls below
+`fraction`. The hash is BLAKE2b of the seed and the IČO rather than Polars'
+`hash`, whose values change between Polars versions: membership of a firm
+does not depend on the stage, the dtype of its id column (``IČO``, ``ico``,
+``firm_ico``) or the library version. Another `seed` draws a different sample
+of the same size, and a larger fraction keeps every firm of a smaller one.
+
+Artefacts of a dev run are written to a mirror of the project tree under
+``dev/<namespace>/`` (e.g. ``dev/p5_s0/data/data_ready/...`` and
+``dev/p5_s0/plots/`` for 5 % of the firms with seed 0), so they never
+overwrite or mix with full-sample outputs:
+
+- `dev_output(path, mode)`: where a stage writes (`path` itself when dev mode is off);
+- `dev_input(path, mode)`: where a stage reads: the namespaced output of the
+  previous stage's dev run when there is one, otherwise a sampled copy of the
+  full-sample input (firm tables filtered, firm-free tables such as the
+  star-schema dimensions copied), rebuilt when the full input changes. A dev
+  run can therefore start at any stage.
+
+The setting is read from ``specs/dev_mode.json`` (``"fraction": null`` is
+off) and can be overridden for a run with the ``PANEL_DEV_FRACTION`` and
+``PANEL_DEV_SEED`` environment variables.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, TypeVar, Union
+
+import polars as pl
+
+from utils.fingerprint import source_fingerprint
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+PathT = TypeVar("PathT", str, Path)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEV_CONFIG_PATH = os.path.join(PROJECT_ROOT, "specs", "dev_mode.json")
+DEV_DIR = "dev"
+FRACTION_ENV = "PANEL_DEV_FRACTION"
+SEED_ENV = "PANEL_DEV_SEED"
+# Firm id column of each stage: raw exports, cleaned MagnusWeb panel, merged panel
+FIRM_ID_COLS = ("firm_ico", "ico", "IČO")
+SAMPLE_SUFFIX = ".dev_sample.json"
+
+
+@dataclass(frozen=True)
+class DevMode:
+    """Keep the firms whose hash bucket is below `fraction` (None = full sample)."""
+    fraction: Optional[float] = None
+    seed: int = 0
+
+    def __post_init__(self):
+        if self.fraction is not None and not 0 < self.fraction <= 1:
+            raise ValueError(f"Dev-mode fraction must be in (0, 1], got {self.fraction}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.fraction is not None
+
+    @property
+    def namespace(self) -> str:
+        """Directory name of the run's artefacts, e.g. ``p5_s0`` for 5 % with seed 0."""
+        return f"p{self.fraction * 100:g}_s{self.seed}".replace(".", "_")
+
+
+def load_dev_mode(path: str = DEV_CONFIG_PATH) -> DevMode:
+    """Dev-mode setting from the config file and the environment (off when neither sets a fraction)."""
+    config = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    fraction = os.environ.get(FRACTION_ENV, config.get("fraction"))
+    seed = os.environ.get(SEED_ENV, config.get("seed", 0))
+    return DevMode(None if fraction in (None, "") else float(fraction), int(seed))
+
+
+def canonical_ico(ico) -> str:
+    """IČO as text without surrounding whitespace and leading zeros."""
+    if isinstance(ico, float) and ico.is_integer():
+        ico = int(ico)
+    return str(ico).strip().lstrip("0")
+
+
+def firm_bucket(ico, seed: int = 0) -> float:
+    """Position of a firm in [0, 1), stable across runs, stages and library versions."""
+    digest = hashlib.blake2b(f"{seed}:{canonical_ico(ico)}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64
+
+
+def firm_filter(col: str, mode: DevMode) -> pl.Expr:
+    """Boolean expression selecting the sampled firms (each distinct id is hashed once per batch)."""
+    def keep(ids: pl.Series) -> pl.Series:
+        kept = [v for v in ids.unique().drop_nulls().to_list() if firm_bucket(v, mode.seed) < mode.fraction]
+        return ids.is_in(pl.Series(kept, dtype=ids.dtype))
+
+    return pl.col(col).map_batches(keep, return_dtype=pl.Boolean, is_elementwise=True)
+
+
+def firm_id_col(columns: Iterable[str]) -> Optional[str]:
+    """The firm id column among `columns` (None for firm-free tables)."""
+    columns = set(columns)
+    return next((c for c in FIRM_ID_COLS if c in columns), None)
+
+
+def sample_firms(frame: Frame, mode: DevMode, col: Optional[str] = None) -> Frame:
+    """Rows of the sampled firms (all rows when dev mode is off); `col` defaults to the detected id column."""
+    if not mode.enabled:
+        return frame
+    col = col or firm_id_col(frame.lazy().collect_schema().names())
+    if col is None:
+        raise KeyError(f"No firm id column ({', '.join(FIRM_ID_COLS)}) to sample on")
+    return frame.filter(firm_filter(col, mode))
+
+
+def namespaced(path: PathT, mode: DevMode) -> PathT:
+    """`path` mirrored under ``<project>/dev/<namespace>/``."""
+    relative = os.path.relpath(os.path.abspath(path), PROJECT_ROOT)
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        raise ValueError(f"{path} is outside the project ({PROJECT_ROOT}) and cannot be namespaced")
+    return type(path)(os.path.join(PROJECT_ROOT, DEV_DIR, mode.namespace, relative))
+
+
+def dev_output(path: PathT, mode: DevMode) -> PathT:
+    """Where a stage writes `path`: its namespaced location (parent created) in dev mode."""
+    if not mode.enabled:
+        return path
+    target = namespaced(path, mode)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # a stage output replaces a sampled copy of the full-sample file
+    if os.path.exists(f"{target}{SAMPLE_SUFFIX}"):
+        os.remove(f"{target}{SAMPLE_SUFFIX}")
+    return target
+
+
+def _sample_parquet(source: str, target: str, mode: DevMode) -> None:
+    lf = pl.scan_parquet(source)
+    col = firm_id_col(lf.collect_schema().names())
+    if col is None:
+        shutil.copyfile(source, target)
+    else:
+        lf.filter(firm_filter(col, mode)).sink_parquet(target)
+
+
+def dev_input(path: PathT, mode: DevMode) -> PathT:
+    """
+    Where a stage reads `path` (a Parquet file or a directory of them) in dev
+    mode: the namespaced output of a dev run of the producing stage, or else a
+    sampled copy of the full-sample file, made on first use and whenever the
+    full-sample file changed. Returns the namespaced path in any case.
+    """
+    if not mode.enabled:
+        return path
+    target = namespaced(path, mode)
+    marker = f"{target}{SAMPLE_SUFFIX}"
+    if os.path.exists(target) and not os.path.exists(marker):
+        return target
+    if not os.path.exists(path):
+        return target  # nothing to sample; the stage reports the missing input
+    fingerprint = source_fingerprint(str(path))
+    if os.path.exists(target):
+        with open(marker, encoding="utf-8") as f:
+            if json.load(f)["source"] == fingerprint:
+                return target
+    if os.path.isdir(path):
+        os.makedirs(target, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".parquet"):
+                _sample_parquet(os.path.join(path, name), os.path.join(target, name), mode)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _sample_parquet(str(path), str(target), mode)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"source": fingerprint, "fraction": mode.fraction, "seed": mode.seed}, f, indent=2)
+        f.write("\n")
+    print(f"Dev mode ({mode.namespace}): sampled {path} -> {target}")
+    return target
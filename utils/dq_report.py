@@ -0,0 +1,227 @@
+"""
+Metadata-first data-quality validation.
+
+Row counts, null counts and min/max of a Parquet file are read from the footer
+statistics whenever every row group carries them (they are exact there, no data
+pages are touched). Anything the footer cannot answer - columns without
+statistics, distinct counts, means, medians, threshold counts - is computed in
+one fused `select` over a lazy scan that reads only the referenced columns.
+The same profile can be built for an in-memory frame, in which case everything
+comes from the single aggregation.
+"""
+
+from typing import Dict, List, Optional, Union
+
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+ROWS_KEY = "__rows"
+STAT_KEYS = ("null_count", "min", "max")
+DIAG_QUANTILES = (0.005, 0.01, 0.5, 0.99, 0.995)
+
+
+def _alias(col: str, stat: str) -> str:
+    return f"{col}__{stat}"
+
+
+def parquet_footer_stats(path: str, cols: Optional[List[str]] = None) -> Dict:
+    """
+    Read row count and exact per-column statistics from a Parquet footer.
+
+    Returns ``{"rows": n, "columns": {col: {"null_count", "min", "max"}}}``.
+    A statistic is only reported when every row group provides it; columns
+    without complete statistics are omitted (or carry only the available keys).
+    Float min/max ignore NaN, as Polars' `min`/`max` do.
+    """
+    import pyarrow.parquet as pq
+
+    meta = pq.ParquetFile(path).metadata
+    names = [meta.schema.column(i).path for i in range(meta.num_columns)]
+    wanted = set(cols) if cols is not None else set(names)
+
+    columns: Dict[str, Dict] = {}
+    for idx, name in enumerate(names):
+        if name not in wanted:
+            continue
+        nulls, lows, highs = 0, [], []
+        has_nulls = has_min_max = meta.num_row_groups > 0
+        for rg in range(meta.num_row_groups):
+            stats = meta.row_group(rg).column(idx).statistics
+            if stats is None:
+                has_nulls = has_min_max = False
+                break
+            if stats.has_null_count:
+                nulls += stats.null_count
+            else:
+                has_nulls = False
+            if stats.has_min_max:
+                lows.append(stats.min)
+                highs.append(stats.max)
+            elif stats.num_values > 0:
+                # a row group with values but no min/max makes the bounds unknown
+                has_min_max = False
+        entry = {}
+        if has_nulls:
+            entry["null_count"] = nulls
+        if has_min_max and lows:
+            entry["min"] = min(lows)
+            entry["max"] = max(highs)
+        columns[name] = entry
+    return {"rows": meta.num_rows, "columns": columns}
+
+
+def column_profile(
+    source: Union[str, Frame],
+    cols: List[str],
+    extra: Optional[List[pl.Expr]] = None,
+) -> Dict:
+    """
+    Row count, null count, min and max for `cols`, plus any `extra` aggregates.
+
+    `source` is a Parquet path or a (lazy) frame. For a path, statistics that
+    are exact in the footer are taken from it and only the remainder is
+    aggregated. `extra` expressions must be aliased aggregations; their results
+    are returned under ``"extra"``.
+    """
+    extra = extra or []
+    if isinstance(source, str):
+        footer = parquet_footer_stats(source, cols)
+        lf = pl.scan_parquet(source)
+        rows = footer["rows"]
+        known = footer["columns"]
+    else:
+        lf = source.lazy()
+        rows = None
+        known = {}
+
+    available = set(lf.collect_schema().names())
+    cols = [c for c in cols if c in available]
+
+    aggs = [] if rows is not None else [pl.len().alias(ROWS_KEY)]
+    for col in cols:
+        for stat in STAT_KEYS:
+            if stat in known.get(col, {}):
+                continue
+            expr = getattr(pl.col(col), stat)()
+            aggs.append(expr.alias(_alias(col, stat)))
+    aggs.extend(extra)
+
+    computed = lf.select(aggs).collect().row(0, named=True) if aggs else {}
+    if rows is None:
+        rows = computed[ROWS_KEY]
+
+    columns = {}
+    for col in cols:
+        entry = {stat: known[col][stat] if stat in known.get(col, {}) else computed[_alias(col, stat)]
+                 for stat in STAT_KEYS}
+        entry["count"] = rows - entry["null_count"]
+        columns[col] = entry
+
+    return {
+        "rows": rows,
+        "columns": columns,
+        "extra": {e.meta.output_name(): computed[e.meta.output_name()] for e in extra},
+        "from_footer": sorted(c for c in cols if known.get(c)),
+    }
+
+
+def group_completeness(profile: Dict, cols: List[str]) -> Optional[Dict]:
+    """
+    Observed/possible cell counts of a column group and its lowest and highest
+    coverage column, derived from a profile without touching the data.
+    """
+    present = [c for c in cols if c in profile["columns"]]
+    if not present:
+        return None
+    rows = profile["rows"]
+    coverage = sorted(((c, profile["columns"][c]["count"] / rows if rows else 0.0) for c in present),
+                      key=lambda x: x[1])
+    observed = sum(profile["columns"][c]["count"] for c in present)
+    return {
+        "observed": observed,
+        "possible": len(present) * rows,
+        "share": observed / (len(present) * rows) if rows else 0.0,
+        "lowest": coverage[0],
+        "highest": coverage[-1],
+    }
+
+
+def _quantile_name(q: float) -> str:
+    return "p" + f"{q * 100:g}".replace(".", "_")
+
+
+def distribution_diagnostics(
+    source: Frame,
+    cols: List[str],
+    outlier_threshold: Union[None, float, Dict[str, float]] = None,
+    quantiles: tuple = DIAG_QUANTILES,
+    extra: Optional[List[pl.Expr]] = None,
+) -> Dict:
+    """
+    Distribution statistics of many columns in one aggregation.
+
+    Returns ``{"table": DataFrame, "rows": int, "extra": {...}}``; the table
+    has one row per column with `count`, `null_count`, `n_nonfinite`, `min`,
+    `max`, `mean`, `std`, the `quantiles` (``p1``, ``p99``, ``p0_5`` ...) of the
+    finite values, and with `outlier_threshold` the number and share of finite
+    values with ``|x| > outlier_threshold``. A dict gives per-column thresholds
+    (columns without one get null outlier statistics). `extra` aliased
+    aggregations are evaluated in the same pass.
+    """
+    extra = extra or []
+    lf = source.lazy()
+    available = set(lf.collect_schema().names())
+    cols = [c for c in cols if c in available]
+
+    with_outliers = outlier_threshold is not None
+    if with_outliers and not isinstance(outlier_threshold, dict):
+        outlier_threshold = {col: outlier_threshold for col in cols}
+
+    aggs = [pl.len().alias(ROWS_KEY)]
+    for col in cols:
+        x = pl.col(col)
+        finite = x.filter(x.is_finite())
+        aggs += [
+            x.count().alias(_alias(col, "count")),
+            x.null_count().alias(_alias(col, "null_count")),
+            (x.is_not_null() & ~x.is_finite()).sum().alias(_alias(col, "n_nonfinite")),
+            finite.min().alias(_alias(col, "min")),
+            finite.max().alias(_alias(col, "max")),
+            finite.mean().alias(_alias(col, "mean")),
+            finite.std().alias(_alias(col, "std")),
+        ]
+        aggs += [finite.quantile(q, "nearest").alias(_alias(col, _quantile_name(q))) for q in quantiles]
+        if with_outliers and col in outlier_threshold:
+            aggs.append((finite.abs() > outlier_threshold[col]).sum().alias(_alias(col, "n_outliers")))
+    aggs.extend(extra)
+    computed = lf.select(aggs).collect().row(0, named=True)
+
+    stats = ["count", "null_count", "n_nonfinite", "min", "max", "mean", "std"] + [_quantile_name(q) for q in quantiles]
+    if with_outliers:
+        stats.append("n_outliers")
+    rows = computed[ROWS_KEY]
+    records = []
+    for col in cols:
+        record = {"column": col, **{stat: computed.get(_alias(col, stat)) for stat in stats}}
+        record["coverage"] = record["count"] / rows if rows else 0.0
+        if with_outliers:
+            finite_count = record["count"] - record["n_nonfinite"]
+            if record["n_outliers"] is None:
+                record["outlier_share"] = None
+            else:
+                record["outlier_share"] = record["n_outliers"] / finite_count if finite_count else 0.0
+        records.append(record)
+
+    schema = {"column": pl.String, "count": pl.Int64, "null_count": pl.Int64, "n_nonfinite": pl.Int64}
+    schema.update({stat: pl.Float64 for stat in stats if stat not in schema and stat != "n_outliers"})
+    if with_outliers:
+        schema["n_outliers"] = pl.Int64
+    schema["coverage"] = pl.Float64
+    if with_outliers:
+        schema["outlier_share"] = pl.Float64
+    return {
+        "table": pl.DataFrame(records, schema=schema, orient="row") if records else pl.DataFrame(schema=schema),
+        "rows": rows,
+        "extra": {e.meta.output_name(): computed[e.meta.output_name()] for e in extra},
+    }
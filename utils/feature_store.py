@@ -0,0 +1,264 @@
+"""
+Persisted engineered-feature store for the panel analysis scripts.
+
+`01_panel.py` and `01_panel upgrade.py` derive the same model variables (margin
+change and lags, firm age, leverage and its lag, log assets, sales growth,
+sector wage growth) from the analysis panel. `FEATURE_REGISTRY` declares them
+once; `build_features` applies the sample scope (`PanelScope`: year window,
+required columns, minimum years per firm), computes every feature in a few
+sorted `with_columns` batches and stores the result as a variant of the
+column store (`utils/column_store.py`). The variant name is a hash of
+
+- the content fingerprint of the source panel (file or star-schema directory),
+- the scope,
+- the feature definitions, and
+- the panel columns it keeps,
+
+so a new panel version or a changed definition builds a new variant, and
+unchanged columns of an earlier variant cost no extra disk. The scope filters
+rows, so no kept column can share chunks with the full panel: a variant keeps
+only the panel keys, the scope and feature inputs and the catalog columns
+(every `VARIABLE_SETS` set plus the ones the caller asks for), never the whole
+panel. `load_features` builds on first use and afterwards only memory-maps
+the requested columns (catalog sets, see `utils/catalog.py`, plus features):
+no feature pipeline runs when a session starts.
+
+Features may use earlier features as inputs; they are evaluated in dependency
+batches. Operations:
+
+- ``lag`` / ``diff``: `year_lag` / `year_diff` of the input within the firm
+- ``log``: natural log; ``log_diff``: ``scale * (ln x_t - ln x_{t-1})``
+- ``minus``: ``a - b``
+- ``ratio``: ``(num - subtract) / den`` when ``den > 0`` (inputs num, den[, subtract])
+- ``series_pct``: ``scale * (x_t / x_{t-1} - 1)`` on the deduplicated
+  (`group`, year) series, joined back (sector variables)
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import polars as pl
+
+from utils.catalog import PANEL_KEYS, VARIABLE_SETS, resolve
+from utils.column_store import list_variants, load_manifest, put_variant, read_variant
+from utils.fingerprint import source_fingerprint
+from utils.panel_lag import sort_panel, year_diff, year_lag
+
+FIRM_ID_COL = "firm_ico"
+YEAR_COL = "year"
+VARIANT_PREFIX = "features-"
+FEATURE_OPS = ("lag", "diff", "log", "log_diff", "minus", "ratio", "series_pct")
+# Catalog specs (utils/catalog.py) of the panel columns every variant keeps
+STORE_SPECS = tuple(VARIABLE_SETS)
+
+
+@dataclass(frozen=True)
+class PanelScope:
+    """Estimation universe: years in [year_start, year_end], `require` non-null, firms with >= min_years rows."""
+    year_start: int = 2003
+    year_end: int = 2023
+    require: Tuple[str, ...] = ("firm_operating_margin_cal",)
+    min_years: int = 4
+
+
+@dataclass(frozen=True)
+class FeatureDef:
+    """One engineered variable: `op` applied to `inputs` (panel columns or earlier features)."""
+    name: str
+    op: str
+    inputs: Tuple[str, ...]
+    scale: float = 1.0
+    group: Optional[str] = None
+
+    def __post_init__(self):
+        if self.op not in FEATURE_OPS:
+            raise ValueError(f"Unknown op '{self.op}' for feature '{self.name}' (use one of {FEATURE_OPS})")
+        if self.op == "series_pct" and self.group is None:
+            raise ValueError(f"Feature '{self.name}': 'series_pct' needs a series `group`")
+
+
+FEATURE_REGISTRY: List[FeatureDef] = [
+    # ECM outcome and terms
+    FeatureDef("d_operating_margin", "diff", ("firm_operating_margin_cal",)),
+    FeatureDef("l_operating_margin", "lag", ("firm_operating_margin_cal",)),
+    FeatureDef("l_d_operating_margin", "lag", ("d_operating_margin",)),
+    # firm controls
+    FeatureDef("firm_age", "minus", ("year", "firm_year_founded")),
+    FeatureDef("leverage_ratio", "ratio", ("firm_total_liabilities_and_equity", "firm_total_liabilities_and_equity", "firm_equity")),
+    FeatureDef("leverage_lag", "lag", ("leverage_ratio",)),
+    FeatureDef("l_leverage_ratio", "lag", ("leverage_ratio",)),
+    FeatureDef("log_assets", "log", ("firm_total_assets",)),
+    FeatureDef("l_log_assets", "lag", ("log_assets",)),
+    FeatureDef("sales_growth", "log_diff", ("firm_sales_revenue",), scale=100.0),
+    # sector wage growth (YoY %, on the level 1 sector series)
+    FeatureDef("sector_wage_growth", "series_pct", ("sector_level1_avg_wages_by_nace",), scale=100.0, group="level1_nace_code"),
+]
+
+
+def _scan_source(source: str, columns: Optional[List[str]] = None) -> pl.LazyFrame:
+    if os.path.isdir(source):
+        from utils.star_schema import scan_star
+        return scan_star(source, columns)
+    lf = pl.scan_parquet(source)
+    return lf if columns is None else lf.select(columns)
+
+
+def panel_columns(
+    source: str,
+    registry: Sequence[FeatureDef] = FEATURE_REGISTRY,
+    scope: PanelScope = PanelScope(),
+    specs: Sequence[str] = STORE_SPECS,
+) -> List[str]:
+    """Source columns a variant keeps: keys, scope and feature inputs, and the catalog `specs` (those present)."""
+    inputs = [c for f in registry for c in f.inputs + ((f.group,) if f.group else ())]
+    available = set(_scan_source(source).collect_schema().names())
+    return [c for c in resolve(*PANEL_KEYS, *scope.require, *inputs, *specs) if c in available]
+
+
+def feature_key(
+    source: str,
+    registry: Sequence[FeatureDef] = FEATURE_REGISTRY,
+    scope: PanelScope = PanelScope(),
+    columns: Optional[Sequence[str]] = None,
+) -> str:
+    """Variant name for (source content, scope, feature definitions, kept panel columns)."""
+    payload = {
+        "source": source_fingerprint(source),
+        "scope": asdict(scope),
+        "features": [asdict(f) for f in registry],
+        "columns": sorted(columns) if columns is not None else None,
+    }
+    return VARIANT_PREFIX + hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def _feature_expr(feature: FeatureDef, group: str, year_col: str) -> pl.Expr:
+    x = pl.col(feature.inputs[0])
+    if feature.op == "lag":
+        expr = year_lag(x, 1, group, year_col)
+    elif feature.op == "diff":
+        expr = year_diff(x, 1, group, year_col)
+    elif feature.op == "log":
+        expr = x.log()
+    elif feature.op == "log_diff":
+        expr = year_diff(x.log(), 1, group, year_col)
+    elif feature.op == "minus":
+        expr = x - pl.col(feature.inputs[1])
+    else:
+        den = pl.col(feature.inputs[1])
+        num = x - pl.col(feature.inputs[2]) if len(feature.inputs) > 2 else x
+        expr = pl.when(den > 0).then(num / den).otherwise(None)
+    if feature.scale != 1.0:
+        expr = feature.scale * expr
+    return expr.alias(feature.name)
+
+
+def _series_pct(lf: pl.LazyFrame, feature: FeatureDef, year_col: str) -> pl.LazyFrame:
+    """`series_pct` feature on the deduplicated (group, year) series of the scoped panel."""
+    var, group = feature.inputs[0], feature.group
+    series = sort_panel(lf.select(year_col, group, var).unique(), group, year_col)
+    growth = feature.scale * (pl.col(var) / year_lag(var, 1, group, year_col) - 1)
+    return series.with_columns(growth.alias(feature.name)).select(year_col, group, feature.name)
+
+
+def compile_batches(registry: Sequence[FeatureDef], columns: Sequence[str]) -> List[List[FeatureDef]]:
+    """
+    Group the features whose inputs are available into dependency batches: a
+    feature goes into the batch after the latest batch producing one of its
+    inputs. Features with missing inputs are skipped; a feature named like a
+    panel column replaces it.
+    """
+    level: Dict[str, int] = {c: -1 for c in columns}
+    batches: List[List[FeatureDef]] = []
+    defined = set()
+    for feature in registry:
+        if feature.name in defined:
+            raise ValueError(f"Feature '{feature.name}' is defined twice")
+        defined.add(feature.name)
+        needed = list(feature.inputs) + ([feature.group] if feature.group else [])
+        if not all(c in level for c in needed):
+            continue
+        batch = 1 + max(level[c] for c in needed)
+        level[feature.name] = batch
+        while len(batches) <= batch:
+            batches.append([])
+        batches[batch].append(feature)
+    return batches
+
+
+def scoped_panel(source: str, scope: PanelScope = PanelScope(), columns: Optional[List[str]] = None) -> pl.LazyFrame:
+    """Lazy panel restricted to the scope's years, required columns and firms with enough years."""
+    lf = _scan_source(source, columns).filter(pl.col(YEAR_COL).is_between(scope.year_start, scope.year_end))
+    for col in scope.require:
+        lf = lf.filter(pl.col(col).is_not_null())
+    return lf.filter(pl.len().over(FIRM_ID_COL) >= scope.min_years)
+
+
+def compute_features(
+    panel: pl.LazyFrame,
+    registry: Sequence[FeatureDef] = FEATURE_REGISTRY,
+    group: str = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> Tuple[pl.LazyFrame, List[str]]:
+    """Add every feature whose inputs are present; returns the frame sorted by (group, year) and the feature names."""
+    lf = sort_panel(panel.lazy(), group, year_col)
+    names = []
+    for batch in compile_batches(registry, lf.collect_schema().names()):
+        for feature in batch:
+            if feature.op == "series_pct":
+                lf = lf.join(_series_pct(lf, feature, year_col), on=[year_col, feature.group], how="left", maintain_order="left")
+        lf = lf.with_columns([_feature_expr(f, group, year_col) for f in batch if f.op != "series_pct"])
+        names += [f.name for f in batch]
+    return lf, [f.name for f in registry if f.name in names]
+
+
+def build_features(
+    source: str,
+    store: str,
+    registry: Sequence[FeatureDef] = FEATURE_REGISTRY,
+    scope: PanelScope = PanelScope(),
+    specs: Sequence[str] = STORE_SPECS,
+) -> str:
+    """
+    Materialise the scoped panel columns of `panel_columns` with all features
+    as a column-store variant unless it exists already; returns the variant name.
+    """
+    columns = panel_columns(source, registry, scope, specs)
+    name = feature_key(source, registry, scope, columns)
+    if name in list_variants(store):
+        return name
+    lf, _ = compute_features(scoped_panel(source, scope, columns), registry)
+    put_variant(store, name, lf.collect(engine="streaming"), sort_by=PANEL_KEYS)
+    return name
+
+
+def load_features(
+    source: str,
+    store: str,
+    *specs: str,
+    features: Optional[Sequence[str]] = None,
+    registry: Sequence[FeatureDef] = FEATURE_REGISTRY,
+    scope: PanelScope = PanelScope(),
+    strict: bool = True,
+) -> pl.DataFrame:
+    """
+    Panel keys, the catalog columns resolved from `specs` and the requested
+    `features` (all registry features by default) of the scoped panel, read
+    from the store (built on first use; the variant keeps the `STORE_SPECS`
+    columns and `specs`, so scripts asking for catalog sets share one). Rows are sorted by (firm, year);
+    fixed-width columns share the memory-mapped store buffers. With `strict`,
+    unavailable columns raise KeyError; otherwise they are skipped and reported.
+    """
+    name = build_features(source, store, registry, scope, STORE_SPECS + specs)
+    available = [c["name"] for c in load_manifest(store, name)["columns"]]
+    wanted = resolve(*PANEL_KEYS, *specs)
+    wanted += [f for f in (features if features is not None else [f.name for f in registry]) if f not in wanted]
+    missing = [c for c in wanted if c not in available]
+    if missing and strict:
+        raise KeyError(f"Columns not found in feature variant '{name}': {missing}")
+    if missing:
+        print(f"Feature store: skipping {len(missing)} column(s) not in '{name}': {missing}")
+    return read_variant(store, name, [c for c in wanted if c in available])
+
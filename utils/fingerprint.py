@@ -0,0 +1,75 @@
+"""
+Per-source fingerprints for incremental pipeline stages.
+
+A stage records the content hash of each of its inputs in a small JSON
+manifest next to its output. On the next run `changed_sources` compares the
+current hashes with the manifest, so the stage can rebuild only the output
+blocks that depend on the inputs that actually changed (e.g. the `mac_*`
+columns when only the macro table was updated) instead of the whole panel.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_fingerprint(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """SHA-256 of the file contents (independent of modification time)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path: str) -> str:
+    """Content hash of a Parquet file, or of every Parquet file of a directory (star schema)."""
+    if not os.path.isdir(path):
+        return file_fingerprint(path)
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".parquet"):
+            digest.update(f"{name}:{file_fingerprint(os.path.join(path, name))}\n".encode())
+    return digest.hexdigest()
+
+
+def fingerprint_sources(sources: Dict[str, str]) -> Dict[str, str]:
+    """Fingerprint every named source file."""
+    return {name: file_fingerprint(path) for name, path in sources.items()}
+
+
+def load_manifest(path: str) -> Dict[str, str]:
+    """Source fingerprints recorded by the previous run ({} if there was none)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["sources"]
+
+
+def save_manifest(path: str, fingerprints: Dict[str, str]) -> str:
+    """Record the fingerprints the current output was built from."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"sources": fingerprints}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return path
+
+
+def changed_sources(sources: Dict[str, str], manifest_path: str) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Names of the sources whose content differs from the manifest (all of them
+    when there is no manifest), and the current fingerprints to save once the
+    output has been rebuilt.
+    """
+    current = fingerprint_sources(sources)
+    previous = load_manifest(manifest_path)
+    changed = [name for name, fingerprint in current.items() if previous.get(name) != fingerprint]
+    return changed, current
+
+
+def block_columns(columns: Iterable[str], prefixes: Sequence[str]) -> List[str]:
+    """Columns of a block, i.e. those starting with one of `prefixes` (derived growth columns included)."""
+    prefixes = tuple(prefixes)
+    return [c for c in columns if prefixes and c.startswith(prefixes)]
@@ -0,0 +1,223 @@
+"""
+Firm history point-lookup index for a panel Parquet file.
+
+The index is a small sidecar Parquet (``<panel>.firm_index.parquet``, or
+``_firm_index.parquet`` inside a directory of Parquet parts) with one row per
+contiguous run of a firm's rows inside a row group:
+(`firm_ico`, `file`, `row_group`, `row_start`, `n_rows`). `firm_history`
+reads only the row groups listed for the requested firms (in parallel, and
+only the requested columns) and slices the runs out of them, so looking up a
+handful of IČOs does not scan the panel. The fewer and smaller the row groups
+a firm spans, the cheaper the lookup: with `firm_year` a firm is a single run,
+with a (year, sector, firm) layout it has one run per year in as many row
+groups. A panel that is not clustered by firm therefore gets a firm-sorted
+copy next to it (``<panel>.firm_sorted.parquet``, ``_firm_sorted.parquet``
+inside a directory) in small row groups, and the index points into that copy,
+so the panel keeps the layout chosen for year and sector scans.
+
+The sidecar stores each file's row count and row-group count; a lookup
+against a panel that was rewritten without rebuilding the index fails.
+
+CLI::
+
+    python utils/firm_index.py build  <panel.parquet | panel_dir>
+    python utils/firm_index.py lookup <panel.parquet | panel_dir> <ico> [<ico> ...]
+"""
+
+import json
+import os
+import sys
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import polars as pl
+
+FIRM_ID_COL = "firm_ico"
+YEAR_COL = "year"
+INDEX_SUFFIX = ".firm_index.parquet"
+FIRM_SORTED_SUFFIX = ".firm_sorted.parquet"
+FIRM_SORTED_ROW_GROUP_SIZE = 10_000  # rows per row group of the firm-sorted copy
+META_LAYOUT = b"panel_files"
+
+
+def index_path_for(panel_path: str) -> str:
+    if os.path.isdir(panel_path):
+        return os.path.join(panel_path, "_" + INDEX_SUFFIX.lstrip("."))
+    return panel_path.replace(".parquet", "") + INDEX_SUFFIX
+
+
+def firm_sorted_path_for(panel_path: str) -> str:
+    if os.path.isdir(panel_path):
+        return os.path.join(panel_path, "_" + FIRM_SORTED_SUFFIX.lstrip("."))
+    return panel_path.replace(".parquet", "") + FIRM_SORTED_SUFFIX
+
+
+def panel_files(panel_path: str) -> List[str]:
+    """The panel file, or the Parquet parts of a panel directory (sidecars excluded)."""
+    if not os.path.isdir(panel_path):
+        return [panel_path]
+    return sorted(
+        os.path.join(panel_path, name) for name in os.listdir(panel_path)
+        if name.endswith(".parquet") and not name.startswith("_")
+    )
+
+
+def _file_runs(path: str, firm_col: str) -> Tuple[pl.DataFrame, List[int]]:
+    """Runs of one file and its row-group sizes (reads the firm id column only)."""
+    import pyarrow.parquet as pq
+
+    meta = pq.ParquetFile(path).metadata
+    sizes = [meta.row_group(i).num_rows for i in range(meta.num_row_groups)]
+    # first row of each row group (plus the total), to map a row number to its row group
+    offsets = pl.Series("offsets", np.cumsum([0] + sizes), dtype=pl.Int64)
+
+    runs = (
+        pl.scan_parquet(path)
+        .select(firm_col)
+        .with_row_index("row")
+        .with_columns(pl.col("row").cast(pl.Int64))
+        .with_columns((pl.lit(offsets).search_sorted(pl.col("row"), side="right") - 1).alias("row_group"))
+        # a run is a maximal block of consecutive rows of one firm within one row group
+        .with_columns(
+            ((pl.col(firm_col) != pl.col(firm_col).shift(1)).fill_null(True)
+             | (pl.col("row_group") != pl.col("row_group").shift(1)).fill_null(True))
+            .cum_sum().alias("run")
+        )
+        .group_by("run")
+        .agg(
+            pl.col(firm_col).first(),
+            pl.col("row_group").first(),
+            pl.col("row").first().alias("row_start"),
+            pl.len().alias("n_rows"),
+        )
+        .select(
+            firm_col,
+            pl.lit(os.path.basename(path)).alias("file"),
+            "row_group",
+            (pl.col("row_start") - pl.lit(offsets).gather(pl.col("row_group"))).alias("row_start"),
+            "n_rows",
+        )
+        .collect()
+    )
+    return runs, sizes
+
+
+def _firm_clustered(runs: pl.DataFrame, n_row_groups: int, firm_col: str) -> bool:
+    """Whether every firm is one block of rows (split only at row-group boundaries)."""
+    return runs.height <= runs[firm_col].n_unique() + n_row_groups
+
+
+def _write_firm_sorted(files: List[str], path: str, firm_col: str) -> None:
+    lf = pl.scan_parquet(files)
+    sort_cols = [firm_col] + ([YEAR_COL] if YEAR_COL in lf.collect_schema().names() else [])
+    lf.sort(sort_cols).sink_parquet(path, compression="zstd", row_group_size=FIRM_SORTED_ROW_GROUP_SIZE)
+
+
+def _layout(files: List[str]) -> dict:
+    """Row count and row-group count of each file, keyed by file name."""
+    import pyarrow.parquet as pq
+
+    layout = {}
+    for path in files:
+        meta = pq.ParquetFile(path).metadata
+        layout[os.path.basename(path)] = [meta.num_rows, meta.num_row_groups]
+    return layout
+
+
+def build_firm_index(panel_path: str, index_path: Optional[str] = None, firm_col: str = FIRM_ID_COL) -> str:
+    """
+    Build the sidecar index of a panel file or directory of Parquet parts.
+    When the panel is not clustered by firm, the firm-sorted copy is written
+    first and indexed instead.
+    """
+    import pyarrow.parquet as pq
+
+    index_path = index_path or index_path_for(panel_path)
+    files = panel_files(panel_path)
+    runs = [_file_runs(path, firm_col) for path in files]
+    index = pl.concat([file_runs for file_runs, _ in runs])
+    sorted_path = firm_sorted_path_for(panel_path)
+    if os.path.exists(sorted_path):
+        os.remove(sorted_path)
+    if not _firm_clustered(index, sum(len(sizes) for _, sizes in runs), firm_col):
+        _write_firm_sorted(files, sorted_path, firm_col)
+        index, _ = _file_runs(sorted_path, firm_col)
+        files = files + [sorted_path]
+    layout = _layout(files)
+
+    index = index.sort(firm_col, "file", "row_group", "row_start")
+    table = index.to_arrow().replace_schema_metadata({META_LAYOUT: json.dumps(layout).encode()})
+    pq.write_table(table, index_path)
+    return index_path
+
+
+def load_firm_index(panel_path: str, index_path: Optional[str] = None) -> pl.DataFrame:
+    """Read the sidecar index and check that it matches the panel's footers."""
+    import pyarrow.parquet as pq
+
+    index_path = index_path or index_path_for(panel_path)
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"No firm index for {panel_path}; run build_firm_index first")
+    table = pq.read_table(index_path)
+    stored = json.loads((table.schema.metadata or {}).get(META_LAYOUT, b"{}"))
+    sorted_path = firm_sorted_path_for(panel_path)
+    current = _layout(panel_files(panel_path) + ([sorted_path] if os.path.exists(sorted_path) else []))
+    if stored != current:
+        raise ValueError(f"Firm index {index_path} is stale for {panel_path}; rebuild it")
+    return pl.from_arrow(table)
+
+
+def firm_history(
+    panel_path: str,
+    firm_ids: Iterable,
+    columns: Optional[List[str]] = None,
+    index: Optional[pl.DataFrame] = None,
+    firm_col: str = FIRM_ID_COL,
+) -> pl.DataFrame:
+    """
+    All rows of the given firms, sorted by firm and year, reading only the
+    row groups that contain them. Pass a loaded `index` to avoid re-reading
+    the sidecar in repeated lookups.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    index = index if index is not None else load_firm_index(panel_path)
+    runs = index.filter(pl.col(firm_col).is_in(list(firm_ids)))
+    folder = panel_path if os.path.isdir(panel_path) else os.path.dirname(panel_path)
+    if columns is not None:
+        columns = [firm_col] + [c for c in columns if c != firm_col]
+
+    pieces = []
+    for (file,), file_runs in runs.group_by("file", maintain_order=True):
+        panel = pq.ParquetFile(os.path.join(folder, file))
+        row_groups = sorted(file_runs["row_group"].unique().to_list())
+        table = panel.read_row_groups(row_groups, columns=columns)
+        # position of each row group inside the concatenated table
+        sizes = [panel.metadata.row_group(rg).num_rows for rg in row_groups]
+        base = dict(zip(row_groups, np.cumsum([0] + sizes[:-1])))
+        pieces += [table.slice(int(base[rg]) + start, n)
+                   for rg, start, n in file_runs.select("row_group", "row_start", "n_rows").iter_rows()]
+
+    if not pieces:
+        panel = pq.ParquetFile(panel_files(panel_path)[0])
+        schema = panel.schema_arrow if columns is None else pa.schema([panel.schema_arrow.field(c) for c in columns])
+        return pl.from_arrow(schema.empty_table())
+    history = pl.from_arrow(pa.concat_tables(pieces))
+    sort_cols = [firm_col] + ([YEAR_COL] if YEAR_COL in history.columns else [])
+    return history.sort(sort_cols)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("build", "lookup"):
+        print("Usage: python utils/firm_index.py build <panel.parquet>")
+        print("       python utils/firm_index.py lookup <panel.parquet> <ico> [<ico> ...]")
+        sys.exit(1)
+    command, panel_file = sys.argv[1], sys.argv[2]
+    if command == "build":
+        print(f"Firm index written to {build_firm_index(panel_file)}")
+    else:
+        firm_dtype = pl.read_parquet_schema(panel_files(panel_file)[0])[FIRM_ID_COL]
+        wanted = pl.Series(sys.argv[3:]).cast(firm_dtype).to_list()
+        with pl.Config(tbl_rows=-1, tbl_cols=12):
+            print(firm_history(panel_file, wanted))
@@ -0,0 +1,159 @@
+"""
+Batched year-over-year growth rates for the firm-year panel.
+
+Every growth column (``_logyoy``, ``_pct``, ``_dpp`` and base-100 ``_pct``)
+is compiled into one `with_columns` batch over a frame sorted once by
+(group, year). The previous year of a variable is the year-indexed
+`year_lag` of `utils/panel_lag.py` (null when the firm skipped that year), a
+plain sorted pass with no per-variable window partition; each variable's lag
+is built once and shared by all transforms that use it, and the optimiser
+evaluates the common subexpressions once.
+
+Sector and macro variables are constant within a (sector, year) or a year, so
+`add_panel_growth` computes their growth on the deduplicated dimension series
+(e.g. the star-schema dimension tables) and joins it back on the dimension
+keys: the firm panel only carries firm-level transforms, and a firm that
+changes sector or skips a year gets its sector's own year-over-year change.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import polars as pl
+
+from utils.panel_lag import sort_panel, year_lag
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+FIRM_ID_COL = "firm_ico"
+YEAR_COL = "year"
+
+LOGYOY_SUFFIX = "_logyoy"
+PCT_SUFFIX = "_pct"
+DPP_SUFFIX = "_dpp"
+
+
+def compile_growth(
+    log_vars: Sequence[str] = (),
+    pct_vars: Sequence[str] = (),
+    dpp_vars: Sequence[str] = (),
+    base100_vars: Sequence[str] = (),
+    group: Optional[str] = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> Tuple[List[pl.Expr], List[str]]:
+    """
+    Growth expressions (in the order log, pct, dpp, base-100) and their
+    output names, for a frame sorted by (group, year):
+
+    - ``X_logyoy = ln(X_t) - ln(X_{t-1})``, null unless both values are > 0
+    - ``X_pct = 100 * (X_t / X_{t-1} - 1)``, null if the lag is null, zero or not finite
+    - ``X_dpp = X_t - X_{t-1}``
+    - ``X_pct = X - 100`` for base-100 indices
+
+    ``X_{t-1}`` is the value of the previous calendar year (null across gaps).
+    With `group=None` the frame is a single series sorted by year.
+    """
+    lags: Dict[str, pl.Expr] = {}
+
+    def lag(var: str) -> pl.Expr:
+        if var not in lags:
+            lags[var] = year_lag(var, 1, group, year_col)
+        return lags[var]
+
+    exprs = []
+    for var in log_vars:
+        x, prev = pl.col(var), lag(var)
+        exprs.append(pl.when((x > 0) & (prev > 0)).then(x.log() - prev.log()).alias(f"{var}{LOGYOY_SUFFIX}"))
+    for var in pct_vars:
+        x, prev = pl.col(var), lag(var)
+        invalid = prev.is_null() | (prev == 0) | ~prev.is_finite()
+        exprs.append(pl.when(invalid).then(None).otherwise(100 * (x / prev - 1)).alias(f"{var}{PCT_SUFFIX}"))
+    for var in dpp_vars:
+        exprs.append((pl.col(var) - lag(var)).alias(f"{var}{DPP_SUFFIX}"))
+    for var in base100_vars:
+        exprs.append((pl.col(var) - 100).alias(f"{var}{PCT_SUFFIX}"))
+    names = [e.meta.output_name() for e in exprs]
+    return exprs, names
+
+
+def add_growth_columns(
+    df: Frame,
+    log_vars: Sequence[str] = (),
+    pct_vars: Sequence[str] = (),
+    dpp_vars: Sequence[str] = (),
+    base100_vars: Sequence[str] = (),
+    group: Optional[str] = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> Tuple[Frame, List[str]]:
+    """
+    Add all growth columns in one pass and return the frame with the list of
+    new column names. The frame is sorted by (group, year) once (eager frames
+    that are already sorted are not re-sorted); eager frames are routed
+    through the lazy engine so shared lags are computed once.
+    """
+    exprs, names = compile_growth(log_vars, pct_vars, dpp_vars, base100_vars, group, year_col)
+    is_lazy = isinstance(df, pl.LazyFrame)
+    lf = sort_panel(df, group, year_col).lazy().with_columns(exprs)
+    return (lf if is_lazy else lf.collect()), names
+
+
+def add_panel_growth(
+    panel: Frame,
+    dimensions: Dict[str, Tuple[Frame, Sequence[str]]],
+    log_vars: Sequence[str] = (),
+    pct_vars: Sequence[str] = (),
+    dpp_vars: Sequence[str] = (),
+    base100_vars: Sequence[str] = (),
+    group: str = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> Tuple[Frame, List[str]]:
+    """
+    Like `add_growth_columns`, but variables of a dimension are transformed on
+    the dimension series and joined back instead of lagged within firms.
+
+    `dimensions` maps a name to (frame, keys): a frame unique on `keys`, which
+    are column names shared with the panel and include `year_col` (e.g. the
+    star-schema ``sector_level1`` table with ``["level1_code", "year"]``, or
+    ``macro`` with ``["year"]``). A variable is taken from the first dimension
+    that has it; the rest are firm-level. The new columns keep the order
+    `add_growth_columns` would give them.
+    """
+    is_lazy = isinstance(panel, pl.LazyFrame)
+    groups = {"log_vars": list(log_vars), "pct_vars": list(pct_vars),
+              "dpp_vars": list(dpp_vars), "base100_vars": list(base100_vars)}
+    _, names = compile_growth(**groups, group=group, year_col=year_col)
+
+    claimed = set()
+    blocks = []
+    for frame, keys in dimensions.values():
+        lf = frame.lazy()
+        available = set(lf.collect_schema().names()) - set(keys) - claimed
+        dim_groups = {kind: [v for v in vs if v in available] for kind, vs in groups.items()}
+        dim_vars = {v for vs in dim_groups.values() for v in vs}
+        if not dim_vars:
+            continue
+        claimed |= dim_vars
+        series_keys = [k for k in keys if k != year_col]
+        if len(series_keys) > 1:
+            raise ValueError(f"Dimension keys {list(keys)} must be at most one series key plus '{year_col}'")
+        series_group = series_keys[0] if series_keys else None
+        series = lf.select(list(keys) + sorted(dim_vars))
+        series, dim_names = add_growth_columns(series, **dim_groups, group=series_group, year_col=year_col)
+        blocks.append((series.select(list(keys) + dim_names), list(keys)))
+
+    firm_groups = {kind: [v for v in vs if v not in claimed] for kind, vs in groups.items()}
+    firm_exprs, _ = compile_growth(**firm_groups, group=group, year_col=year_col)
+    lf = sort_panel(panel, group, year_col).lazy().with_columns(firm_exprs)
+    for block, keys in blocks:
+        lf = lf.join(block, on=keys, how="left", maintain_order="left")
+
+    base_cols = [c for c in panel.lazy().collect_schema().names() if c not in names]
+    lf = lf.select(base_cols + names)
+    return (lf if is_lazy else lf.collect()), names
+
+
+def negative_shares(df: Frame, cols: Sequence[str]) -> Dict[str, float]:
+    """Share of rows with a negative value of each column, in one aggregation."""
+    if not cols:
+        return {}
+    row = df.lazy().select([((pl.col(c) < 0).sum() / pl.len()).alias(c) for c in cols]).collect().row(0, named=True)
+    return {c: float(v or 0.0) for c, v in row.items()}
@@ -0,0 +1,111 @@
+"""
+Single-pass evaluation of accounting identities and sign rules.
+
+Every rule is a row-level violation predicate. `violation_index` evaluates all
+rules in one `select`, packs them into a per-row bitmask and returns a compact
+long index of (row_id, firm, year, rule_code) for violating rows only. Rule
+counts and the filtered panel are both derived from that index, so the panel
+is never rescanned per rule.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import polars as pl
+
+ROW_ID_COL = "row_id"
+RULE_COL = "rule_code"
+FIRM_ID_COL = "ico"
+YEAR_COL = "year"
+MAX_RULES = 32
+
+
+@dataclass(frozen=True)
+class IdentityRule:
+    """
+    A data-quality rule. `violation` evaluates to True for violating rows;
+    null results (missing inputs) are treated as no violation.
+    """
+    code: str
+    description: str
+    violation: pl.Expr
+    required: List[str] = field(default_factory=list)
+
+
+def default_accounting_rules(max_balance_sheet_gap: float) -> List[IdentityRule]:
+    """Sign rules and the balance sheet identity applied in the DQ pipeline."""
+    assets = pl.col("total_assets")
+    liab_eq = pl.col("total_liabilities_and_equity")
+    return [
+        IdentityRule("NEG_SALES", "negative sales", pl.col("sales_revenue") < 0, ["sales_revenue"]),
+        IdentityRule("NEG_TURNOVER", "negative turnover", pl.col("turnover") < 0, ["turnover"]),
+        IdentityRule("NEG_COSTS", "negative costs", pl.col("costs") < 0, ["costs"]),
+        IdentityRule("NEG_ASSETS", "negative assets", assets < 0, ["total_assets"]),
+        IdentityRule("ZERO_ASSETS", "zero assets", assets == 0, ["total_assets"]),
+        IdentityRule(
+            "BS_GAP",
+            f"balance sheet gaps >{max_balance_sheet_gap * 100}%",
+            (assets > 0) & (liab_eq > 0) & ((assets - liab_eq).abs() / assets > max_balance_sheet_gap),
+            ["total_assets", "total_liabilities_and_equity"],
+        ),
+    ]
+
+
+def applicable_rules(df, rules: List[IdentityRule]) -> List[IdentityRule]:
+    """Keep the rules whose input columns are present in the frame."""
+    columns = set(df.lazy().collect_schema().names())
+    return [rule for rule in rules if all(col in columns for col in rule.required)]
+
+
+def violation_index(
+    df,
+    rules: List[IdentityRule],
+    keys: List[str] = (FIRM_ID_COL, YEAR_COL),
+) -> pl.DataFrame:
+    """
+    Evaluate all rules in one pass and return the violation index.
+
+    One row per (violating row, violated rule); `row_id` is the row position
+    in `df`. Rows without violations do not appear in the index.
+    """
+    if len(rules) > MAX_RULES:
+        raise ValueError(f"At most {MAX_RULES} rules can be packed into the violation mask")
+
+    keys = [k for k in keys if k in df.lazy().collect_schema().names()]
+    bit_terms = [
+        pl.when(rule.violation.fill_null(False)).then(pl.lit(1 << i, pl.UInt32)).otherwise(pl.lit(0, pl.UInt32))
+        for i, rule in enumerate(rules)
+    ]
+    mask = pl.fold(acc=pl.lit(0, pl.UInt32), function=lambda acc, x: acc | x, exprs=bit_terms)
+    codes = pl.concat_list([
+        pl.when((pl.col("__mask") & (1 << i)) > 0).then(pl.lit(rule.code))
+        for i, rule in enumerate(rules)
+    ]).list.drop_nulls()
+
+    return (
+        df.lazy()
+        .with_row_index(ROW_ID_COL)
+        .select([ROW_ID_COL] + keys + [mask.alias("__mask")])
+        .filter(pl.col("__mask") > 0)
+        .with_columns(codes.alias(RULE_COL))
+        .drop("__mask")
+        .explode(RULE_COL)
+        .with_columns(pl.col(RULE_COL).cast(pl.Enum([rule.code for rule in rules])))
+        .collect()
+    )
+
+
+def violation_counts(index: pl.DataFrame, rules: List[IdentityRule]) -> Dict[str, int]:
+    """Number of violating rows per rule (rows may violate several rules)."""
+    counts = dict(index.group_by(RULE_COL).len().iter_rows())
+    return {rule.code: counts.get(rule.code, 0) for rule in rules}
+
+
+def drop_violations(df: pl.DataFrame, index: pl.DataFrame) -> pl.DataFrame:
+    """Remove every row that appears in the violation index."""
+    bad_rows = index.get_column(ROW_ID_COL).unique()
+    return (
+        df.with_row_index(ROW_ID_COL)
+        .filter(~pl.col(ROW_ID_COL).is_in(bad_rows))
+        .drop(ROW_ID_COL)
+    )
@@ -0,0 +1,255 @@
+"""
+Declarative join contracts checked before a merge runs.
+
+A `JoinContract` states the expected cardinality of a join (``1:1``, ``m:1``,
+``1:m`` or ``m:m``) and the minimum share of left rows that must find a match.
+`check_contract` verifies it from key statistics alone: each side is reduced
+to one row per key (grouped on a 64-bit hash of the key columns, in a
+streaming pass that reads only the key columns), and the two small key tables
+are joined to obtain duplicate keys, coverage and the exact row count the
+left join would produce. A duplicated right key, which multiplies firm-year
+rows, is therefore reported with sample keys before the expensive join runs.
+`check_unique` applies the same check to a single table (e.g. the long sector
+table before it is pivoted).
+
+Distinct keys that collide on the hash are counted as one, so the statistics
+can only undercount keys, never hide a duplicate. Keys reported as duplicated
+are re-checked on the raw key columns before a violation is raised, so a
+collision cannot fail a contract.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import polars as pl
+
+KEY_HASH_COL = "__key_hash"
+HASH_SEED = 20250716
+CARDINALITIES = ("1:1", "m:1", "1:m", "m:m")
+
+
+class JoinContractError(ValueError):
+    """Raised when a join violates its contract."""
+
+
+@dataclass(frozen=True)
+class JoinContract:
+    """
+    Expected shape of a left join.
+
+    `cardinality` is ``<left>:<right>``: a ``1`` side must be unique on its
+    join keys. `min_coverage` is the minimum share of left rows whose key
+    exists on the right (rows with a null key count as unmatched).
+    """
+    name: str
+    left_on: Tuple[str, ...]
+    right_on: Tuple[str, ...]
+    cardinality: str = "m:1"
+    min_coverage: float = 0.0
+    sample_size: int = 5
+
+    def __post_init__(self):
+        if self.cardinality not in CARDINALITIES:
+            raise ValueError(f"Unknown cardinality '{self.cardinality}' (use one of {CARDINALITIES})")
+        if len(self.left_on) != len(self.right_on):
+            raise ValueError(f"Contract '{self.name}': left_on and right_on differ in length")
+
+
+@dataclass
+class ContractReport:
+    """Key statistics of both sides and the violations found."""
+    contract: JoinContract
+    left_rows: int
+    left_keys: int
+    left_duplicate_keys: int
+    right_rows: int
+    right_keys: int
+    right_duplicate_keys: int
+    matched_rows: int
+    expected_rows: int
+    violations: List[str] = field(default_factory=list)
+    samples: Dict[str, pl.DataFrame] = field(default_factory=dict)
+
+    @property
+    def coverage(self) -> float:
+        return self.matched_rows / self.left_rows if self.left_rows else 1.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.violations
+
+    def summary(self) -> str:
+        c = self.contract
+        lines = [
+            f"[{'OK' if self.ok else 'VIOLATED'}] {c.name} ({c.cardinality}, min coverage {c.min_coverage:.0%})",
+            f"  left : {self.left_rows:,} rows, {self.left_keys:,} keys, {self.left_duplicate_keys:,} duplicated",
+            f"  right: {self.right_rows:,} rows, {self.right_keys:,} keys, {self.right_duplicate_keys:,} duplicated",
+            f"  coverage {self.coverage:.1%}, left join would return {self.expected_rows:,} rows",
+        ]
+        lines += [f"  - {v}" for v in self.violations]
+        for side, sample in self.samples.items():
+            lines.append(f"  sample duplicated {side} keys:\n{sample}")
+        return "\n".join(lines)
+
+
+def common_key_dtypes(
+    left: pl.LazyFrame, right: pl.LazyFrame, left_on: Sequence[str], right_on: Sequence[str]
+) -> List[pl.DataType]:
+    """
+    Supertype of each left/right key pair (e.g. Int64 for an Int16 firm-panel
+    year against an Int64 dimension year), as a join would upcast them. The
+    key hash depends on the dtype, so both sides are cast to it before hashing.
+    Pairs a join would reject (e.g. String against Int16) raise
+    `JoinContractError`.
+    """
+    left_schema, right_schema = left.collect_schema(), right.collect_schema()
+    dtypes = []
+    for l, r in zip(left_on, right_on):
+        left_dtype, right_dtype = left_schema[l], right_schema[r]
+        numeric_pair = (left_dtype.is_integer() and right_dtype.is_integer()) or (
+            left_dtype.is_float() and right_dtype.is_float()
+        )
+        if left_dtype != right_dtype and not numeric_pair:
+            raise JoinContractError(f"Join keys '{l}' ({left_dtype}) and '{r}' ({right_dtype}) have incompatible dtypes")
+        dtypes.append(pl.concat(
+            [pl.DataFrame(schema={"key": left_dtype}), pl.DataFrame(schema={"key": right_dtype})],
+            how="vertical_relaxed",
+        ).schema["key"])
+    return dtypes
+
+
+def _select_keys(lf: pl.LazyFrame, keys: List[str], dtypes: Optional[Sequence[pl.DataType]]) -> pl.LazyFrame:
+    if dtypes is None:
+        return lf.select(keys)
+    return lf.select([pl.col(k).cast(dtype) for k, dtype in zip(keys, dtypes)])
+
+
+def key_stats(lf: pl.LazyFrame, keys: Sequence[str], dtypes: Optional[Sequence[pl.DataType]] = None) -> pl.DataFrame:
+    """
+    One row per distinct non-null key: its hash, the key values and the number
+    of rows (`n`). Rows with a null key component are counted under a null hash.
+    `dtypes` casts the keys before hashing (see `common_key_dtypes`).
+    """
+    keys = list(keys)
+    key_hash = (
+        pl.when(pl.all_horizontal(pl.col(k).is_not_null() for k in keys))
+        .then(pl.struct(keys).hash(HASH_SEED))
+        .alias(KEY_HASH_COL)
+    )
+    return (
+        _select_keys(lf, keys, dtypes)
+        .with_columns(key_hash)
+        .group_by(KEY_HASH_COL)
+        .agg([pl.col(k).first() for k in keys] + [pl.len().alias("n")])
+        .collect(engine="streaming")
+    )
+
+
+def confirm_duplicates(
+    lf: pl.LazyFrame,
+    keys: Sequence[str],
+    dupes: pl.DataFrame,
+    dtypes: Optional[Sequence[pl.DataType]] = None,
+) -> pl.DataFrame:
+    """
+    The keys of `dupes` (rows of `key_stats` with n > 1, hashed with the same
+    `dtypes`) that are duplicated on the raw key columns, with their row
+    counts; drops hash collisions of distinct keys. Reads only the rows whose
+    hash is among `dupes`.
+    """
+    keys = list(keys)
+    if dupes.is_empty():
+        return dupes
+    hashes = dupes[KEY_HASH_COL].implode()
+    return (
+        _select_keys(lf, keys, dtypes)
+        .filter(pl.struct(keys).hash(HASH_SEED).is_in(hashes) & pl.all_horizontal(pl.col(k).is_not_null() for k in keys))
+        .group_by(keys)
+        .agg(pl.len().alias("n"))
+        .filter(pl.col("n") > 1)
+        .with_columns(pl.struct(keys).hash(HASH_SEED).alias(KEY_HASH_COL))
+        .select([KEY_HASH_COL] + keys + ["n"])
+        .collect(engine="streaming")
+    )
+
+
+def check_unique(lf: pl.LazyFrame, keys: Sequence[str], name: str, sample_size: int = 5) -> int:
+    """
+    Raise `JoinContractError` with sample keys if `lf` has more than one row
+    for a key; returns the number of distinct keys otherwise.
+    """
+    stats = key_stats(lf, keys)
+    valid = stats.filter(pl.col(KEY_HASH_COL).is_not_null())
+    dupes = confirm_duplicates(lf, keys, valid.filter(pl.col("n") > 1))
+    print(f"[{'VIOLATED' if dupes.height else 'OK'}] {name} unique on {list(keys)}: "
+          f"{int(stats['n'].sum()):,} rows, {valid.height:,} keys, {dupes.height:,} duplicated")
+    if dupes.height:
+        sample = dupes.sort("n", descending=True).head(sample_size).drop(KEY_HASH_COL)
+        raise JoinContractError(f"{name}: {dupes.height:,} keys {list(keys)} occur more than once\n{sample}")
+    return valid.height
+
+
+def check_contract(left: pl.LazyFrame, right: pl.LazyFrame, contract: JoinContract) -> ContractReport:
+    """Check `contract` for `left.join(right, ...)` without running the join."""
+    dtypes = common_key_dtypes(left, right, contract.left_on, contract.right_on)
+    left_stats = key_stats(left, contract.left_on, dtypes)
+    right_stats = key_stats(right, contract.right_on, dtypes)
+
+    left_valid = left_stats.filter(pl.col(KEY_HASH_COL).is_not_null())
+    right_valid = right_stats.filter(pl.col(KEY_HASH_COL).is_not_null())
+    left_dupes = left_valid.filter(pl.col("n") > 1)
+    right_dupes = right_valid.filter(pl.col("n") > 1)
+
+    # Rows of the left join: every left row times max(1, right multiplicity of its key)
+    paired = left_stats.join(
+        right_valid.select(KEY_HASH_COL, pl.col("n").alias("n_right")), on=KEY_HASH_COL, how="left"
+    )
+    totals = paired.select(
+        (pl.col("n") * pl.col("n_right").fill_null(1)).sum().alias("expected"),
+        pl.col("n").filter(pl.col("n_right").is_not_null()).sum().alias("matched"),
+    ).row(0, named=True)
+
+    report = ContractReport(
+        contract=contract,
+        left_rows=int(left_stats["n"].sum()),
+        left_keys=left_valid.height,
+        left_duplicate_keys=left_dupes.height,
+        right_rows=int(right_stats["n"].sum()),
+        right_keys=right_valid.height,
+        right_duplicate_keys=right_dupes.height,
+        matched_rows=int(totals["matched"] or 0),
+        expected_rows=int(totals["expected"] or 0),
+    )
+
+    left_side, right_side = contract.cardinality.split(":")
+    for side, unique_required, lf, dupes, keys in (
+        ("left", left_side == "1", left, left_dupes, contract.left_on),
+        ("right", right_side == "1", right, right_dupes, contract.right_on),
+    ):
+        if unique_required and dupes.height:
+            dupes = confirm_duplicates(lf, keys, dupes, dtypes)
+            setattr(report, f"{side}_duplicate_keys", dupes.height)
+        if unique_required and dupes.height:
+            report.violations.append(f"{dupes.height:,} {side} keys {list(keys)} occur more than once")
+            report.samples[side] = dupes.sort("n", descending=True).head(contract.sample_size).drop(KEY_HASH_COL)
+    if report.coverage < contract.min_coverage:
+        report.violations.append(f"coverage {report.coverage:.1%} is below the required {contract.min_coverage:.0%}")
+    return report
+
+
+def validate_joins(
+    checks: Sequence[Tuple[pl.LazyFrame, pl.LazyFrame, JoinContract]],
+    raise_on_violation: bool = True,
+) -> List[ContractReport]:
+    """
+    Check several (left, right, contract) triples, print their summaries and
+    raise `JoinContractError` listing every violated contract.
+    """
+    reports = [check_contract(left, right, contract) for left, right, contract in checks]
+    for report in reports:
+        print(report.summary())
+    failed = [r for r in reports if not r.ok]
+    if failed and raise_on_violation:
+        details = "; ".join(f"{r.contract.name}: {', '.join(r.violations)}" for r in failed)
+        raise JoinContractError(f"Join contracts violated - {details}")
+    return reports
@@ -0,0 +1,192 @@
+"""
+Keyed diff between two versions of a (firm, year) panel.
+
+The comparison is staged so that unchanged data is never compared cell by cell
+and neither panel is loaded in full:
+
+1. Row hashes: one 64-bit hash per row over the shared columns, streamed
+   together with the keys. An outer join of the two (keys, hash) tables
+   yields added, removed and changed firm-years; unchanged rows drop out.
+2. Column fingerprints: for every shared column, an order-independent sum of
+   hashes of (keys, value) over the changed rows, one streaming `select` per
+   panel. Columns with equal fingerprints are unchanged and skipped.
+3. Cells: only the changed rows and changed columns of both panels are read
+   and compared, giving per-column counts of changed cells, cells that became
+   null or non-null, and mean/max absolute differences for numeric columns.
+   A firm-year counts as changed only if one of its cells differs here, so
+   rows whose differences are all within `tolerance` (or NaN vs NaN) count
+   as unchanged.
+
+Run ``python utils/panel_diff.py <old> <new>`` to print the report; a panel is
+a Parquet file or a star-schema directory.
+"""
+
+import os
+import sys
+from typing import Dict, List, Optional, Sequence, Union
+
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+PANEL_KEYS = ["firm_ico", "year"]
+HASH_SEED = 20250716
+ROW_HASH_COL = "__row_hash"
+SAMPLE_SIZE = 5
+
+
+def _scan_panel(source: Union[str, Frame]) -> pl.LazyFrame:
+    if not isinstance(source, str):
+        return source.lazy()
+    if os.path.isdir(source):
+        from utils.star_schema import scan_star
+        return scan_star(source)
+    return pl.scan_parquet(source)
+
+
+def column_fingerprints(lf: pl.LazyFrame, cols: Sequence[str], keys: Sequence[str] = PANEL_KEYS) -> Dict[str, int]:
+    """Order-independent fingerprint of each column (sum of hashes of keys and value, mod 2^64)."""
+    if not cols:
+        return {}
+    row = lf.select(
+        [pl.struct(list(keys) + [c]).hash(HASH_SEED).sum().alias(c) for c in cols]
+    ).collect(engine="streaming").row(0, named=True)
+    return dict(row)
+
+
+def _row_hashes(lf: pl.LazyFrame, cols: Sequence[str], keys: Sequence[str]) -> pl.DataFrame:
+    row_hash = pl.struct(list(cols)).hash(HASH_SEED) if cols else pl.lit(0, pl.UInt64)
+    return lf.select(list(keys) + [row_hash.alias(ROW_HASH_COL)]).collect(engine="streaming")
+
+
+def _cells_equal(old: pl.Expr, new: pl.Expr, numeric: bool, tolerance: float) -> pl.Expr:
+    equal = old.eq_missing(new)
+    if numeric:
+        both_nan = old.cast(pl.Float64).is_nan() & new.cast(pl.Float64).is_nan()
+        close = (old.cast(pl.Float64) - new.cast(pl.Float64)).abs() <= tolerance
+        equal = equal | both_nan.fill_null(False) | close.fill_null(False)
+    return equal
+
+
+def diff_panels(
+    old: Union[str, Frame],
+    new: Union[str, Frame],
+    keys: Sequence[str] = PANEL_KEYS,
+    columns: Optional[List[str]] = None,
+    tolerance: float = 0.0,
+) -> Dict:
+    """
+    Compare two panel versions keyed on `keys` (unique in each panel).
+
+    Returns a dict with `rows` (counts of old, new, added, removed, changed and
+    unchanged firm-years), `added_columns` / `removed_columns`,
+    `unchanged_columns` (no cell differs on the common rows), `added` / `removed` (key
+    frames), `columns` (one row per changed column with `changed_cells`,
+    `became_null`, `became_non_null`, `mean_abs_diff`, `max_abs_diff`) and
+    `samples` (a few changed cells per column). Numeric differences up to
+    `tolerance` are treated as equal, in the row counts as in the cells.
+    """
+    keys = list(keys)
+    old_lf, new_lf = _scan_panel(old), _scan_panel(new)
+    old_schema, new_schema = old_lf.collect_schema(), new_lf.collect_schema()
+
+    shared = [c for c in old_schema.names() if c in new_schema and c not in keys]
+    if columns is not None:
+        shared = [c for c in shared if c in columns]
+
+    # 1. row hashes: added, removed and changed firm-years
+    paired = _row_hashes(old_lf, shared, keys).join(
+        _row_hashes(new_lf, shared, keys), on=keys, how="full", coalesce=True, suffix="_new"
+    )
+    in_old = pl.col(ROW_HASH_COL).is_not_null()
+    in_new = pl.col(f"{ROW_HASH_COL}_new").is_not_null()
+    added = paired.filter(~in_old).select(keys)
+    removed = paired.filter(~in_new).select(keys)
+    changed_keys = paired.filter(in_old & in_new & (pl.col(ROW_HASH_COL) != pl.col(f"{ROW_HASH_COL}_new"))).select(keys)
+
+    rows = {
+        "old": paired.filter(in_old).height,
+        "new": paired.filter(in_new).height,
+        "added": added.height,
+        "removed": removed.height,
+    }
+
+    # 2. column fingerprints over the changed rows: equal fingerprints are skipped
+    changed_cols = []
+    if changed_keys.height:
+        old_fp = column_fingerprints(old_lf.join(changed_keys.lazy(), on=keys, how="semi"), shared, keys)
+        new_fp = column_fingerprints(new_lf.join(changed_keys.lazy(), on=keys, how="semi"), shared, keys)
+        changed_cols = [c for c in shared if old_fp[c] != new_fp[c]]
+
+    # 3. cell comparison on the changed rows and columns
+    column_rows, samples = [], {}
+    row_differs = []
+    if changed_keys.height and changed_cols:
+        cells = (
+            old_lf.select(keys + changed_cols).join(changed_keys.lazy(), on=keys, how="semi")
+            .join(
+                new_lf.select(keys + changed_cols).join(changed_keys.lazy(), on=keys, how="semi"),
+                on=keys, how="inner", suffix="__new",
+            )
+            .collect()
+        )
+        for c in changed_cols:
+            numeric = old_schema[c].is_numeric() and new_schema[c].is_numeric()
+            o, n = pl.col(c), pl.col(f"{c}__new")
+            differs = ~_cells_equal(o, n, numeric, tolerance)
+            row_differs.append(differs)
+            abs_diff = (o.cast(pl.Float64) - n.cast(pl.Float64)).abs().filter(differs) if numeric else pl.lit(None, pl.Float64)
+            stats = cells.select(
+                differs.sum().alias("changed_cells"),
+                (o.is_not_null() & n.is_null()).sum().alias("became_null"),
+                (o.is_null() & n.is_not_null()).sum().alias("became_non_null"),
+                abs_diff.mean().alias("mean_abs_diff"),
+                abs_diff.max().alias("max_abs_diff"),
+            ).row(0, named=True)
+            if stats["changed_cells"]:
+                column_rows.append({"column": c, **stats})
+                samples[c] = cells.filter(differs).select(keys + [o.alias("old"), n.alias("new")]).head(SAMPLE_SIZE)
+        # changed firm-years: at least one cell differs beyond `tolerance`
+        rows["changed"] = cells.filter(pl.any_horizontal(row_differs)).height
+    else:
+        rows["changed"] = 0
+    rows["unchanged"] = rows["old"] - rows["removed"] - rows["changed"]
+    with_changes = {r["column"] for r in column_rows}
+
+    column_schema = {
+        "column": pl.String, "changed_cells": pl.UInt32, "became_null": pl.UInt32,
+        "became_non_null": pl.UInt32, "mean_abs_diff": pl.Float64, "max_abs_diff": pl.Float64,
+    }
+    return {
+        "rows": rows,
+        "added_columns": [c for c in new_schema.names() if c not in old_schema],
+        "removed_columns": [c for c in old_schema.names() if c not in new_schema],
+        "unchanged_columns": [c for c in shared if c not in with_changes],
+        "added": added,
+        "removed": removed,
+        "columns": pl.DataFrame(column_rows, schema=column_schema, orient="row").sort("changed_cells", descending=True),
+        "samples": samples,
+    }
+
+
+def format_diff(diff: Dict, max_columns: int = 30) -> str:
+    """Human-readable report of `diff_panels`."""
+    r = diff["rows"]
+    lines = [
+        f"Rows: old {r['old']:,}, new {r['new']:,} | added {r['added']:,}, removed {r['removed']:,}, "
+        f"changed {r['changed']:,}, unchanged {r['unchanged']:,}",
+        f"Columns: {len(diff['unchanged_columns'])} unchanged, {diff['columns'].height} with changed cells, "
+        f"added {diff['added_columns'] or 'none'}, removed {diff['removed_columns'] or 'none'}",
+    ]
+    if diff["columns"].height:
+        with pl.Config(tbl_rows=max_columns, tbl_cols=-1, fmt_str_lengths=60):
+            lines.append(str(diff["columns"].head(max_columns)))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python utils/panel_diff.py <old panel> <new panel>")
+        sys.exit(1)
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    print(format_diff(diff_panels(sys.argv[1], sys.argv[2])))
@@ -0,0 +1,88 @@
+"""
+Year-indexed lag, lead and difference operators for the firm-year panel.
+
+`shift(1).over(firm)` takes the previous *row* of a firm, which is two or more
+years back when the firm skipped a year. `year_lag(x, k)` instead returns the
+value of year t-k of the same firm and null when that year is missing. On a
+frame sorted by (group, year) and unique on it, year t-k can only be among
+the k previous rows, so the operator is a single sorted pass: for each of
+those rows it compares the shifted group and year with the target and takes
+the first match (for k = 1 one comparison). No self-join and no window
+partition are needed, and the expressions compose with any other
+`with_columns` batch.
+"""
+
+from typing import Optional, Union
+
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+FIRM_ID_COL = "firm_ico"
+YEAR_COL = "year"
+
+
+def is_panel_sorted(df: pl.DataFrame, group: str = FIRM_ID_COL, year_col: str = YEAR_COL) -> bool:
+    """True if `df` is sorted by (group, year); uses the sorted flag when set."""
+    if df.height < 2:
+        return True
+    keys = df.select(group, year_col)
+    if keys[group].flags["SORTED_ASC"] and keys[year_col].flags["SORTED_ASC"]:
+        return True
+    g, y = pl.col(group), pl.col(year_col)
+    in_order = (g > g.shift(1)) | ((g == g.shift(1)) & (y >= y.shift(1)))
+    return bool(keys.select(in_order.slice(1).all()).item())
+
+
+def sort_panel(df: Frame, group: Optional[str] = FIRM_ID_COL, year_col: str = YEAR_COL) -> Frame:
+    """
+    Sort by (group, year) unless an eager frame already is; marks `group` as
+    sorted. With `group=None` (one series, e.g. macro) the frame is sorted by year.
+    """
+    if group is None:
+        return df.sort(year_col)
+    if isinstance(df, pl.DataFrame) and is_panel_sorted(df, group, year_col):
+        return df if df[group].flags["SORTED_ASC"] else df.with_columns(pl.col(group).set_sorted())
+    return df.sort([group, year_col]).with_columns(pl.col(group).set_sorted())
+
+
+def _year_shift(
+    x: Union[str, pl.Expr],
+    k: int,
+    group: Optional[str],
+    year_col: str,
+) -> pl.Expr:
+    """Value of year t-k (k > 0) or t+|k| (k < 0) of the same group, else null."""
+    if k == 0:
+        raise ValueError("The lag/lead order must be non-zero")
+    x = pl.col(x) if isinstance(x, str) else x
+    year = pl.col(year_col)
+    step = 1 if k > 0 else -1
+    shifted = None
+    for j in range(1, abs(k) + 1):
+        s = step * j
+        match = year.shift(s) == year - k
+        if group is not None:
+            match = match & (pl.col(group).shift(s) == pl.col(group))
+        shifted = (pl.when(match) if shifted is None else shifted.when(match)).then(x.shift(s))
+    return shifted
+
+
+def year_lag(x: Union[str, pl.Expr], k: int = 1, group: Optional[str] = FIRM_ID_COL, year_col: str = YEAR_COL) -> pl.Expr:
+    """
+    Value of `x` in year t-k of the same group; null if that year is not
+    observed. `x` is a column name or an expression. The frame must be sorted
+    by (group, year) and unique on it; `group=None` for a single series.
+    """
+    return _year_shift(x, k, group, year_col)
+
+
+def year_lead(x: Union[str, pl.Expr], k: int = 1, group: Optional[str] = FIRM_ID_COL, year_col: str = YEAR_COL) -> pl.Expr:
+    """Value of `x` in year t+k of the same group; null if that year is not observed."""
+    return _year_shift(x, -k, group, year_col)
+
+
+def year_diff(x: Union[str, pl.Expr], k: int = 1, group: Optional[str] = FIRM_ID_COL, year_col: str = YEAR_COL) -> pl.Expr:
+    """``x_t - x_{t-k}`` within the group; null across gaps."""
+    expr = pl.col(x) if isinstance(x, str) else x
+    return expr - _year_shift(expr, k, group, year_col)
@@ -0,0 +1,271 @@
+"""
+Storage layout optimiser for the merged panel Parquet.
+
+A `ParquetLayout` fixes the physical layout of the file: the sort order of the
+rows, the row-group size, the compression codec and level, and which columns
+are dictionary-encoded. Sorting by (year, sector, firm) makes the per-row-group
+min/max statistics narrow, so `scan_parquet` can skip row groups for year,
+sector and firm predicates instead of reading the whole file.
+
+`benchmark_layouts` writes the panel under several layouts and times lazy
+scans with the predicates used by the analysis scripts; `select_layout`
+picks the fastest one and `save_layout_config` records it in
+`specs/parquet_layout.json`, from which `load_layout` reads it when the panel
+is written (`write_panel`).
+
+Run ``python utils/parquet_layout.py <panel.parquet>`` to benchmark the
+predefined layouts and update the config.
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+LAYOUT_CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "specs", "parquet_layout.json"
+)
+YEAR_COL = "year"
+FIRM_ID_COL = "firm_ico"
+LEVEL1_COL = "level1_nace_code"
+LEVEL2_COL = "level2_nace_code"
+BENCHMARK_REPEATS = 3
+
+
+@dataclass(frozen=True)
+class ParquetLayout:
+    """
+    Physical layout of a Parquet file.
+
+    `sort_by` is applied before writing (nulls last). `dictionary` lists the
+    dictionary-encoded columns: None keeps the writer default (every column),
+    an empty tuple disables dictionary encoding.
+    """
+    name: str
+    sort_by: Tuple[str, ...] = ()
+    row_group_size: int = 100_000
+    compression: str = "zstd"
+    compression_level: Optional[int] = None
+    dictionary: Optional[Tuple[str, ...]] = None
+
+
+SECTOR_DICTIONARY = (LEVEL1_COL, LEVEL2_COL, "level1_nace_en_name", "level2_nace_en_name")
+
+LAYOUTS: Dict[str, ParquetLayout] = {
+    layout.name: layout
+    for layout in (
+        # unsorted, as written by a plain `write_parquet`
+        ParquetLayout("unsorted", row_group_size=512 * 512),
+        ParquetLayout("year_sector_firm", sort_by=(YEAR_COL, LEVEL1_COL, LEVEL2_COL, FIRM_ID_COL)),
+        ParquetLayout(
+            "year_sector_firm_small_rg",
+            sort_by=(YEAR_COL, LEVEL1_COL, LEVEL2_COL, FIRM_ID_COL),
+            row_group_size=25_000,
+            dictionary=SECTOR_DICTIONARY,
+        ),
+        ParquetLayout(
+            "year_sector_firm_zstd9",
+            sort_by=(YEAR_COL, LEVEL1_COL, LEVEL2_COL, FIRM_ID_COL),
+            compression_level=9,
+            dictionary=SECTOR_DICTIONARY,
+        ),
+        ParquetLayout("firm_year", sort_by=(FIRM_ID_COL, YEAR_COL)),
+        ParquetLayout(
+            "year_sector_firm_snappy",
+            sort_by=(YEAR_COL, LEVEL1_COL, LEVEL2_COL, FIRM_ID_COL),
+            compression="snappy",
+        ),
+    )
+}
+DEFAULT_LAYOUT = "year_sector_firm"
+
+
+def write_panel(df: Frame, path: str, layout: ParquetLayout) -> str:
+    """Write `df` to `path` with the given layout (sorted, with row-group statistics)."""
+    import pyarrow.parquet as pq
+
+    lf = df.lazy()
+    names = lf.collect_schema().names()
+    missing = [c for c in layout.sort_by if c not in names]
+    if missing:
+        raise KeyError(f"Layout '{layout.name}' sorts by columns not in the panel: {missing}")
+    if layout.sort_by:
+        lf = lf.sort(list(layout.sort_by), nulls_last=True, maintain_order=True)
+    table = lf.collect().to_arrow()
+
+    use_dictionary = True if layout.dictionary is None else [c for c in layout.dictionary if c in names] or False
+    pq.write_table(
+        table,
+        path,
+        row_group_size=layout.row_group_size,
+        compression=layout.compression,
+        compression_level=layout.compression_level,
+        use_dictionary=use_dictionary,
+        write_statistics=True,
+    )
+    return path
+
+
+def typical_predicates(df: Frame) -> Dict[str, pl.Expr]:
+    """
+    Filters used by the analysis scripts, with values drawn from the panel:
+    the estimation window, a single year, the most populated level 1 and
+    level 2 sectors, and one firm's history.
+    """
+    lf = df.lazy()
+    names = lf.collect_schema().names()
+    firms = pl.col(FIRM_ID_COL).drop_nulls().unique().sort()
+    stats = lf.select(
+        pl.col(YEAR_COL).min().alias("first"),
+        pl.col(YEAR_COL).max().alias("last"),
+        firms.get(firms.len() // 2).alias(FIRM_ID_COL),
+        *[pl.col(c).drop_nulls().mode().sort().first().alias(c) for c in (LEVEL1_COL, LEVEL2_COL) if c in names],
+    ).collect().row(0, named=True)
+
+    mid = (stats["first"] + stats["last"]) // 2
+    predicates = {
+        "year_window": pl.col(YEAR_COL).is_between(mid - 5, stats["last"]),
+        "single_year": pl.col(YEAR_COL) == mid,
+    }
+    for col, key in ((LEVEL1_COL, "level1_sector"), (LEVEL2_COL, "level2_sector")):
+        if col in stats:
+            predicates[key] = pl.col(col) == stats[col]
+    predicates["firm_history"] = pl.col(FIRM_ID_COL) == stats[FIRM_ID_COL]
+    return predicates
+
+
+def _time_scan(path: str, predicate: pl.Expr, columns: Optional[List[str]], repeats: int) -> Tuple[float, int]:
+    """Best-of-`repeats` wall time of a filtered lazy scan, and the rows returned."""
+    best, rows = float("inf"), 0
+    for _ in range(repeats):
+        lf = pl.scan_parquet(path).filter(predicate)
+        if columns is not None:
+            lf = lf.select(columns)
+        start = time.perf_counter()
+        rows = lf.collect().height
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+
+def benchmark_layouts(
+    df: Frame,
+    out_dir: str,
+    layouts: Optional[Sequence[ParquetLayout]] = None,
+    predicates: Optional[Dict[str, pl.Expr]] = None,
+    columns: Optional[List[str]] = None,
+    repeats: int = BENCHMARK_REPEATS,
+    keep_files: bool = False,
+) -> pl.DataFrame:
+    """
+    Write `df` under each layout and time every predicate on a lazy scan.
+
+    Returns one row per (layout, predicate) with the scan time, rows returned,
+    file size, row-group count and write time. `columns` restricts the scans
+    to a projection (e.g. a model's variables). Layout files are removed
+    afterwards unless `keep_files`.
+    """
+    import pyarrow.parquet as pq
+
+    layouts = list(layouts) if layouts is not None else list(LAYOUTS.values())
+    panel = df.lazy().collect()
+    predicates = predicates if predicates is not None else typical_predicates(panel)
+    os.makedirs(out_dir, exist_ok=True)
+
+    rows = []
+    for layout in layouts:
+        path = os.path.join(out_dir, f"{layout.name}.parquet")
+        start = time.perf_counter()
+        write_panel(panel, path, layout)
+        write_seconds = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / 1024**2
+        row_groups = pq.ParquetFile(path).metadata.num_row_groups
+        for name, predicate in predicates.items():
+            seconds, n = _time_scan(path, predicate, columns, repeats)
+            rows.append({
+                "layout": layout.name,
+                "predicate": name,
+                "scan_seconds": seconds,
+                "rows": n,
+                "size_mb": size_mb,
+                "row_groups": row_groups,
+                "write_seconds": write_seconds,
+            })
+        if not keep_files:
+            os.remove(path)
+
+    results = pl.DataFrame(rows)
+    inconsistent = results.group_by("predicate").agg(pl.col("rows").n_unique().alias("n")).filter(pl.col("n") > 1)
+    if inconsistent.height:
+        raise RuntimeError(f"Layouts returned different rows for predicates {inconsistent['predicate'].to_list()}")
+    return results
+
+
+def select_layout(results: pl.DataFrame, weights: Optional[Dict[str, float]] = None) -> str:
+    """Name of the layout with the lowest (weighted) total scan time."""
+    weights = weights or {}
+    totals = (
+        results.with_columns(
+            pl.col("predicate").replace_strict(weights, default=1.0, return_dtype=pl.Float64).alias("weight")
+        )
+        .group_by("layout")
+        .agg((pl.col("scan_seconds") * pl.col("weight")).sum().alias("total"))
+        .sort("total", "layout")
+    )
+    return totals["layout"][0]
+
+
+def save_layout_config(layout: Union[str, ParquetLayout], path: str = LAYOUT_CONFIG_PATH) -> str:
+    """Record the layout used when writing the panel (a predefined name or a full spec)."""
+    if isinstance(layout, str):
+        if layout not in LAYOUTS:
+            raise KeyError(f"Unknown layout '{layout}' (predefined: {sorted(LAYOUTS)})")
+        layout = LAYOUTS[layout]
+    spec = asdict(layout)
+    spec["sort_by"] = list(layout.sort_by)
+    spec["dictionary"] = None if layout.dictionary is None else list(layout.dictionary)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"layout": spec}, f, indent=2)
+        f.write("\n")
+    return path
+
+
+def load_layout(path: str = LAYOUT_CONFIG_PATH) -> ParquetLayout:
+    """
+    Layout from the config file: ``{"layout": "<predefined name>"}`` or a full
+    spec. Falls back to `DEFAULT_LAYOUT` when the file does not exist.
+    """
+    if not os.path.exists(path):
+        return LAYOUTS[DEFAULT_LAYOUT]
+    with open(path, encoding="utf-8") as f:
+        spec = json.load(f)["layout"]
+    if isinstance(spec, str):
+        if spec not in LAYOUTS:
+            raise KeyError(f"Unknown layout '{spec}' in {path} (predefined: {sorted(LAYOUTS)})")
+        return LAYOUTS[spec]
+    spec = dict(spec)
+    spec["sort_by"] = tuple(spec.get("sort_by", ()))
+    if spec.get("dictionary") is not None:
+        spec["dictionary"] = tuple(spec["dictionary"])
+    return ParquetLayout(**spec)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python utils/parquet_layout.py <panel.parquet> [out_dir]")
+        sys.exit(1)
+    panel_path = sys.argv[1]
+    bench_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(panel_path), "_layout_benchmark")
+
+    results = benchmark_layouts(pl.scan_parquet(panel_path), bench_dir)
+    shutil.rmtree(bench_dir, ignore_errors=True)
+    with pl.Config(tbl_rows=-1):
+        print(results.pivot(on="predicate", index=["layout", "size_mb", "row_groups"], values="scan_seconds"))
+    best = select_layout(results)
+    print(f"Fastest layout: {best} -> {save_layout_config(best)}")
@@ -0,0 +1,133 @@
+"""
+Pre-aggregated inputs for diagnostic plots.
+
+Histograms, quantile summaries and per-year counts are computed in Polars so
+that only small arrays (bin edges and counts, a handful of quantiles, one row
+per year) reach matplotlib. `distribution_summary` evaluates every column's
+moments, quantiles and fixed-bin histogram in a single `select`; the bin range
+is either the column's min/max or a quantile range computed in the same query.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+HIST_BINS = 50
+SUMMARY_QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+YEAR_COL = "year"
+
+
+def _alias(col: str, stat: str) -> str:
+    return f"{col}__{stat}"
+
+
+def _quantile_key(q: float) -> str:
+    return f"q{q:g}"
+
+
+def distribution_summary(
+    df: Frame,
+    cols: List[str],
+    bins: int = HIST_BINS,
+    range_q: Optional[Tuple[float, float]] = None,
+    quantiles: Sequence[float] = SUMMARY_QUANTILES,
+) -> Dict[str, Dict]:
+    """
+    Moments, quantiles and a fixed-bin histogram per column in one query.
+
+    Non-finite values are ignored. With `range_q=(lo, hi)` the histogram spans
+    the lo/hi quantiles and values outside are left out (as in a trimmed plot);
+    otherwise it spans min/max. Each entry holds `count`, `nulls`, `mean`,
+    `std`, `min`, `max`, `quantiles` ({q: value}), `edges` (bins + 1) and
+    `counts` (bins).
+    """
+    lf = df.lazy()
+    cols = [c for c in cols if c in lf.collect_schema().names()]
+
+    aggs = []
+    for col in cols:
+        x = pl.when(pl.col(col).is_finite()).then(pl.col(col))
+        if range_q is None:
+            lo, hi = x.min(), x.max()
+        else:
+            lo, hi = x.quantile(range_q[0], "linear"), x.quantile(range_q[1], "linear")
+        width = pl.when(hi > lo).then(hi - lo).otherwise(1.0)
+        bin_idx = (
+            pl.when((x >= lo) & (x <= hi))
+            .then(((x - lo) / width * bins).floor().clip(0, bins - 1))
+            .cast(pl.Int32)
+        )
+        aggs += [
+            x.count().alias(_alias(col, "count")),
+            pl.col(col).null_count().alias(_alias(col, "nulls")),
+            x.mean().alias(_alias(col, "mean")),
+            x.std().alias(_alias(col, "std")),
+            x.min().alias(_alias(col, "min")),
+            x.max().alias(_alias(col, "max")),
+            lo.alias(_alias(col, "lo")),
+            hi.alias(_alias(col, "hi")),
+            bin_idx.drop_nulls().value_counts().implode().alias(_alias(col, "hist")),
+        ]
+        aggs += [x.quantile(q, "linear").alias(_alias(col, _quantile_key(q))) for q in quantiles]
+
+    row = lf.select(aggs).collect().row(0, named=True) if aggs else {}
+
+    summary = {}
+    for col in cols:
+        counts = np.zeros(bins, dtype=np.int64)
+        for entry in row[_alias(col, "hist")]:
+            idx = next(v for k, v in entry.items() if k != "count")
+            counts[idx] = entry["count"]
+        lo, hi = row[_alias(col, "lo")], row[_alias(col, "hi")]
+        if lo is None:
+            lo, hi = 0.0, 1.0
+        elif hi <= lo:
+            hi = lo + 1.0
+        summary[col] = {
+            "count": row[_alias(col, "count")],
+            "nulls": row[_alias(col, "nulls")],
+            "mean": row[_alias(col, "mean")],
+            "std": row[_alias(col, "std")],
+            "min": row[_alias(col, "min")],
+            "max": row[_alias(col, "max")],
+            "quantiles": {q: row[_alias(col, _quantile_key(q))] for q in quantiles},
+            "edges": np.linspace(lo, hi, bins + 1),
+            "counts": counts,
+        }
+    return summary
+
+
+def yearly_summary(
+    df: Frame,
+    cols: List[str],
+    year_col: str = YEAR_COL,
+    firm_col: Optional[str] = None,
+    stats: Sequence[str] = ("count",),
+) -> pl.DataFrame:
+    """
+    One row per year with `<col>_<stat>` for each column and statistic
+    (`count`, `mean`, `median`), plus the number of distinct firms when
+    `firm_col` is given. `count` counts non-null values; `mean` and `median`
+    ignore non-finite values.
+    """
+    lf = df.lazy()
+    cols = [c for c in cols if c in lf.collect_schema().names()]
+
+    def agg(col: str, stat: str) -> pl.Expr:
+        x = pl.col(col) if stat == "count" else pl.when(pl.col(col).is_finite()).then(pl.col(col))
+        return getattr(x, stat)().alias(f"{col}_{stat}")
+
+    aggs = [agg(c, stat) for c in cols for stat in stats]
+    if firm_col is not None:
+        aggs.insert(0, pl.col(firm_col).n_unique().alias("firms"))
+    return lf.group_by(year_col).agg(aggs).sort(year_col).collect()
+
+
+def plot_histogram(ax, summary: Dict, **kwargs):
+    """Draw a pre-aggregated histogram (from `distribution_summary`) on `ax`."""
+    edges, counts = summary["edges"], summary["counts"]
+    centers = (edges[:-1] + edges[1:]) / 2
+    return ax.hist(centers, bins=edges, weights=counts, **kwargs)
@@ -0,0 +1,174 @@
+"""
+Declarative registry of firm-level financial ratios.
+
+Every ratio is declared once as numerator, denominator, scale and guard policy.
+`compile_ratios` turns the registry into a single list of expressions for one
+`with_columns` call: the validity mask of each operand (non-null and finite)
+and each lagged operand is built exactly once and shared by every ratio that
+references it, so the whole ratio step is evaluated in one pass.
+
+Operands are column names; the suffix `@lag` refers to the same firm's value
+in the previous year (e.g. ``"sales_revenue@lag"``), null when that year is
+missing (`utils/panel_lag.year_lag`).
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+import polars as pl
+
+from utils.panel_lag import year_lag
+
+# --- Guard policies for the denominator ---
+GUARD_POSITIVE = "positive"         # denominator > 0
+GUARD_NONZERO = "nonzero"           # denominator != 0
+GUARD_POLICIES = (GUARD_POSITIVE, GUARD_NONZERO)
+
+LAG_SUFFIX = "@lag"
+FIRM_ID_COL = "ico"
+YEAR_COL = "year"
+
+
+@dataclass(frozen=True)
+class RatioSpec:
+    """
+    A single ratio: scale * (numerator - subtract) / denominator.
+
+    The result is null whenever any operand is null or non-finite, or the
+    denominator violates the guard policy.
+    """
+    name: str
+    numerator: str
+    denominator: str
+    scale: float = 1.0
+    guard: str = GUARD_POSITIVE
+    subtract: Optional[str] = None
+
+    def operands(self) -> List[str]:
+        ops = [self.numerator, self.denominator]
+        if self.subtract is not None:
+            ops.append(self.subtract)
+        return ops
+
+
+# --- Default registry (MagnusWeb column names, before the firm_ prefix) ---
+RATIO_REGISTRY: List[RatioSpec] = [
+    # Profitability ratios (in %)
+    RatioSpec("operating_margin_cal", "oper_profit", "sales_revenue", scale=100.0),
+    RatioSpec("net_margin_cal", "profit_net", "sales_revenue", scale=100.0),
+    RatioSpec("roa_ebit_cal", "oper_profit", "total_assets", scale=100.0),
+    RatioSpec("roe_cal", "profit_net", "equity", scale=100.0),
+    # Solvency & cost structure (in %)
+    RatioSpec("equity_ratio_cal", "equity", "total_assets", scale=100.0),
+    RatioSpec("cost_ratio_cal", "costs", "sales_revenue", scale=100.0),
+    # Efficiency & scale (raw ratios)
+    RatioSpec("asset_turnover_cal", "sales_revenue", "total_assets"),
+    RatioSpec("labor_productivity_cal", "sales_revenue", "num_employees"),
+    # Tax diagnostics
+    RatioSpec("effective_tax_rate_cal", "profit_pre_tax", "profit_pre_tax",
+              guard=GUARD_NONZERO, subtract="profit_net"),
+    # Growth dynamics (year-on-year, within firm)
+    RatioSpec("rev_growth_cal", "sales_revenue", "sales_revenue@lag",
+              guard=GUARD_NONZERO, subtract="sales_revenue@lag"),
+    RatioSpec("cost_growth_cal", "costs", "costs@lag",
+              guard=GUARD_NONZERO, subtract="costs@lag"),
+    RatioSpec("op_profit_growth_cal", "oper_profit", "oper_profit@lag",
+              guard=GUARD_NONZERO, subtract="oper_profit@lag"),
+]
+
+
+def _base_column(operand: str) -> str:
+    return operand[:-len(LAG_SUFFIX)] if operand.endswith(LAG_SUFFIX) else operand
+
+
+def _is_lagged(operand: str) -> bool:
+    return operand.endswith(LAG_SUFFIX)
+
+
+def required_columns(registry: List[RatioSpec]) -> List[str]:
+    """Return the input columns referenced by a registry, in first-seen order."""
+    cols: List[str] = []
+    for spec in registry:
+        for op in spec.operands():
+            base = _base_column(op)
+            if base not in cols:
+                cols.append(base)
+    return cols
+
+
+def compile_ratios(
+    registry: List[RatioSpec],
+    group: str = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> List[pl.Expr]:
+    """
+    Compile a ratio registry into one batch of expressions.
+
+    Operand values and validity masks are memoised per operand, so a column
+    shared by several ratios (e.g. sales_revenue) contributes a single mask
+    expression that Polars' common-subexpression elimination evaluates once.
+    Lagged operands assume the frame is sorted by (group, year).
+    """
+    values: Dict[str, pl.Expr] = {}
+    masks: Dict[str, pl.Expr] = {}
+
+    def value(op: str) -> pl.Expr:
+        if op not in values:
+            col = pl.col(_base_column(op))
+            values[op] = year_lag(col, 1, group, year_col) if _is_lagged(op) else col
+        return values[op]
+
+    def valid(op: str) -> pl.Expr:
+        if op not in masks:
+            masks[op] = value(op).is_not_null() & value(op).is_finite()
+        return masks[op]
+
+    exprs = []
+    for spec in registry:
+        if spec.guard not in GUARD_POLICIES:
+            raise ValueError(f"Unknown guard policy '{spec.guard}' for ratio '{spec.name}'")
+
+        den = value(spec.denominator)
+        den_ok = den > 0 if spec.guard == GUARD_POSITIVE else den != 0
+        ok = den_ok
+        for op in spec.operands():
+            ok = ok & valid(op)
+
+        num = value(spec.numerator)
+        if spec.subtract is not None:
+            num = num - value(spec.subtract)
+        ratio = num / den
+        if spec.scale != 1.0:
+            ratio = spec.scale * ratio
+
+        exprs.append(
+            pl.when(ok & ratio.is_finite()).then(ratio).otherwise(None).alias(spec.name)
+        )
+    return exprs
+
+
+def apply_ratios(
+    df: Union[pl.DataFrame, pl.LazyFrame],
+    registry: List[RatioSpec] = RATIO_REGISTRY,
+    group: str = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> Union[pl.DataFrame, pl.LazyFrame]:
+    """
+    Add every ratio of the registry whose inputs are present, in one pass.
+
+    Eager frames are routed through the lazy engine so that shared masks are
+    deduplicated by the optimiser. Frames are sorted by (group, year) only when
+    a lagged operand is used.
+    """
+    is_lazy = isinstance(df, pl.LazyFrame)
+    lf = df if is_lazy else df.lazy()
+
+    columns = set(lf.collect_schema().names())
+    active = [spec for spec in registry
+              if all(_base_column(op) in columns for op in spec.operands())]
+
+    if any(_is_lagged(op) for spec in active for op in spec.operands()):
+        lf = lf.sort([group, year_col])
+
+    lf = lf.with_columns(compile_ratios(active, group=group, year_col=year_col))
+    return lf if is_lazy else lf.collect()
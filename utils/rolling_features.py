@@ -0,0 +1,127 @@
+"""
+Multi-horizon growth and rolling-window firm features in one sorted pass.
+
+Each `FeatureSpec` names a column and the features wanted for it:
+
+- ``{col}_log{h}y``   log change over h years, ln(x_t) - ln(x_{t-h}) (x > 0)
+- ``{col}_cagr{h}y``  compound annual growth over h years, in %
+- ``{col}_d{h}y``     difference over h years, x_t - x_{t-h} (rates, margins)
+- ``{col}_{stat}{w}y`` rolling mean / std over the years t-w+1..t
+
+Windows are calendar years of the same firm, not rows: on a frame sorted by
+(firm, year) the window of row t consists of the previous w-1 rows whose year
+lies within w-1 years of t, so a gap shortens the window instead of reaching
+further back, and `min_periods` sets how many observed values a statistic
+needs. Every feature of every column is one expression of a single
+`with_columns` batch; the shifted neighbours and in-window masks are shared
+across columns and window lengths. Rolling statistics are computed from
+the window values directly (mean first, then squared deviations), since
+global prefix sums of squared CZK levels lose precision.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import polars as pl
+
+from utils.panel_lag import sort_panel, year_lag
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+FIRM_ID_COL = "firm_ico"
+YEAR_COL = "year"
+CHANGE_KINDS = ("log", "diff")
+ROLLING_STATS = ("mean", "std")
+
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    """
+    Features of one column. `change="log"` gives log change and CAGR over each
+    horizon (levels such as revenue), `change="diff"` the plain difference
+    (margins and ratios). `min_periods` defaults to the window length.
+    """
+    column: str
+    horizons: Tuple[int, ...] = (2, 3)
+    change: str = "log"
+    windows: Tuple[int, ...] = (3, 5)
+    stats: Tuple[str, ...] = ("std",)
+    min_periods: Optional[int] = None
+
+    def __post_init__(self):
+        if self.change not in CHANGE_KINDS:
+            raise ValueError(f"Unknown change '{self.change}' for '{self.column}' (use one of {CHANGE_KINDS})")
+        unknown = [s for s in self.stats if s not in ROLLING_STATS]
+        if unknown:
+            raise ValueError(f"Unknown rolling statistics {unknown} for '{self.column}' (use {ROLLING_STATS})")
+
+
+FEATURE_SPECS = [
+    FeatureSpec("firm_operating_margin_cal", change="diff"),
+    FeatureSpec("firm_sales_revenue"),
+    FeatureSpec("firm_costs"),
+]
+
+
+def compile_features(
+    specs: Sequence[FeatureSpec],
+    group: str = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> Tuple[List[pl.Expr], List[str]]:
+    """Feature expressions and their names, for a frame sorted by (group, year)."""
+    year = pl.col(year_col)
+    gaps: Dict[int, pl.Expr] = {}
+
+    def gap(j: int) -> pl.Expr:
+        # years between row t and the row j positions back of the same firm (null otherwise)
+        if j not in gaps:
+            gaps[j] = pl.when(pl.col(group).shift(j) == pl.col(group)).then(year - year.shift(j))
+        return gaps[j]
+
+    def window_values(col: str, w: int) -> List[pl.Expr]:
+        return [pl.col(col)] + [pl.when(gap(j) < w).then(pl.col(col).shift(j)) for j in range(1, w)]
+
+    exprs = []
+    for spec in specs:
+        x = pl.col(spec.column)
+        for h in spec.horizons:
+            prev = year_lag(spec.column, h, group, year_col)
+            if spec.change == "log":
+                log_change = pl.when((x > 0) & (prev > 0)).then(x.log() - prev.log())
+                exprs.append(log_change.alias(f"{spec.column}_log{h}y"))
+                exprs.append((100 * ((log_change / h).exp() - 1)).alias(f"{spec.column}_cagr{h}y"))
+            else:
+                exprs.append((x - prev).alias(f"{spec.column}_d{h}y"))
+        for w in spec.windows:
+            values = window_values(spec.column, w)
+            n = pl.sum_horizontal([v.is_not_null() for v in values])
+            mean = pl.sum_horizontal(values) / n
+            enough = n >= (spec.min_periods or w)
+            for stat in spec.stats:
+                if stat == "mean":
+                    value = mean
+                    valid = enough
+                else:
+                    value = (pl.sum_horizontal([(v - mean) ** 2 for v in values]) / (n - 1)).sqrt()
+                    valid = enough & (n > 1)
+                exprs.append(pl.when(valid).then(value).alias(f"{spec.column}_{stat}{w}y"))
+    return exprs, [e.meta.output_name() for e in exprs]
+
+
+def add_rolling_features(
+    df: Frame,
+    specs: Sequence[FeatureSpec] = FEATURE_SPECS,
+    group: str = FIRM_ID_COL,
+    year_col: str = YEAR_COL,
+) -> Tuple[Frame, List[str]]:
+    """
+    Add the features of every spec whose column is present, in one pass over
+    the frame sorted by (group, year) (an already sorted eager frame is only
+    checked). Returns the frame and the new column names.
+    """
+    is_lazy = isinstance(df, pl.LazyFrame)
+    columns = set(df.lazy().collect_schema().names())
+    active = [spec for spec in specs if spec.column in columns]
+    exprs, names = compile_features(active, group, year_col)
+    lf = sort_panel(df, group, year_col).lazy().with_columns(exprs)
+    return (lf if is_lazy else lf.collect()), names
@@ -0,0 +1,124 @@
+"""
+Cached estimation-sample masks for the pandas regression frame.
+
+Each model of the panel analysis uses the rows that are complete on its
+variables, often restricted further to a sector, a period or an episode.
+Building that sample with `dropna` and boolean indexing copies the whole
+frame every time. `SampleMasks` instead keeps packed bitsets over the rows
+of one frame (`np.packbits`, one bit per row):
+
+- `complete(cols)`: non-missing on every column, cached per distinct set and
+  built from cached per-column masks;
+- `equals(col, value)`: one sector (or other category), cached per value;
+- `period(start, end)` and `years_in(years)`: year conditions on the index.
+
+Bitsets combine with ``&`` (and ``a & ~b`` for exclusions). A model takes its
+(y, X) with `design`, which gathers only the model's columns at the selected
+row positions; `take` and `column` do the same for descriptive statistics.
+Columns may be added to the frame after the cache is created; if a column is
+overwritten, `forget` drops its cached masks.
+"""
+
+from typing import Dict, FrozenSet, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+YEAR_LEVEL = "year"
+
+
+class SampleMasks:
+    """Packed row bitsets over one DataFrame, cached by variable set, category value and period."""
+
+    def __init__(self, df: pd.DataFrame, year_level: str = YEAR_LEVEL):
+        self.df = df
+        self.n_rows = len(df)
+        self._year = np.asarray(df.index.get_level_values(year_level))
+        self._notna: Dict[str, np.ndarray] = {}
+        self._complete: Dict[FrozenSet[str], np.ndarray] = {}
+        self._equals: Dict[Tuple[str, Hashable], np.ndarray] = {}
+        self._period: Dict[Tuple, np.ndarray] = {}
+
+    def pack(self, mask) -> np.ndarray:
+        """Bitset of a boolean row mask (array or Series aligned by position)."""
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (self.n_rows,):
+            raise ValueError(f"Mask has shape {mask.shape}, frame has {self.n_rows:,} rows")
+        return np.packbits(mask)
+
+    def all(self) -> np.ndarray:
+        return self.pack(np.ones(self.n_rows, dtype=bool))
+
+    def notna(self, col: str) -> np.ndarray:
+        if col not in self._notna:
+            self._notna[col] = self.pack(self.df[col].notna())
+        return self._notna[col]
+
+    def complete(self, cols: Iterable[str]) -> np.ndarray:
+        """Rows with no missing value in `cols` (the sample of `dropna(subset=cols)`)."""
+        key = frozenset(cols)
+        if key not in self._complete:
+            bits = self.all()
+            for col in sorted(key):
+                bits = bits & self.notna(col)
+            self._complete[key] = bits
+        return self._complete[key]
+
+    def equals(self, col: str, value: Hashable) -> np.ndarray:
+        """Rows where `col == value`; all values of `col` are indexed on first use."""
+        if (col, value) not in self._equals:
+            codes, uniques = pd.factorize(self.df[col], sort=False)
+            for code, unique in enumerate(uniques):
+                self._equals[(col, unique)] = self.pack(codes == code)
+            if (col, value) not in self._equals:
+                return self.pack(np.zeros(self.n_rows, dtype=bool))
+        return self._equals[(col, value)]
+
+    def period(self, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """Rows with start <= year <= end (open-ended when a bound is None)."""
+        key = ("between", start, end)
+        if key not in self._period:
+            mask = np.ones(self.n_rows, dtype=bool)
+            if start is not None:
+                mask &= self._year >= start
+            if end is not None:
+                mask &= self._year <= end
+            self._period[key] = self.pack(mask)
+        return self._period[key]
+
+    def years_in(self, years: Iterable[int]) -> np.ndarray:
+        key = ("in", tuple(sorted(years)))
+        if key not in self._period:
+            self._period[key] = self.pack(np.isin(self._year, key[1]))
+        return self._period[key]
+
+    def forget(self, col: str) -> None:
+        """Drop cached masks that depend on `col` (after the column was overwritten)."""
+        self._notna.pop(col, None)
+        self._complete = {k: v for k, v in self._complete.items() if col not in k}
+        self._equals = {k: v for k, v in self._equals.items() if k[0] != col}
+
+    def rows(self, bits: np.ndarray) -> np.ndarray:
+        """Row positions selected by a bitset."""
+        return np.flatnonzero(np.unpackbits(bits, count=self.n_rows))
+
+    def count(self, bits: np.ndarray) -> int:
+        return int(np.unpackbits(bits, count=self.n_rows).sum())
+
+    def years_present(self, bits: np.ndarray) -> List[int]:
+        """Sorted distinct years of the selected rows."""
+        return sorted(np.unique(self._year[self.rows(bits)]).tolist())
+
+    def take(self, cols: Sequence[str], bits: np.ndarray) -> pd.DataFrame:
+        """The selected rows of `cols` only (one gather, the frame is not copied)."""
+        positions = [self.df.columns.get_loc(c) for c in cols]
+        return self.df.iloc[self.rows(bits), positions]
+
+    def column(self, col: str, bits: np.ndarray) -> pd.Series:
+        return self.df[col].iloc[self.rows(bits)]
+
+    def design(self, dependent: str, exog: Sequence[str], bits: np.ndarray) -> Tuple[pd.Series, pd.DataFrame]:
+        """(y, X) of a model at the selected rows."""
+        rows = self.rows(bits)
+        positions = [self.df.columns.get_loc(c) for c in exog]
+        return self.df[dependent].iloc[rows], self.df.iloc[rows, positions]
@@ -0,0 +1,74 @@
+"""
+Long-to-wide pivot of the propagated NACE table for all levels at once.
+
+The propagated table is long: one row per (level, czso_code, year, metric)
+with the sector's English name repeated on every row. `sector_blocks` turns it
+into one wide block per NACE level with a single lazy `group_by` over
+(level, czso_code, year): every metric becomes a
+``sector_level{level}_{metric}`` column and the name becomes
+``level{level}_nace_en_name``. The per-level blocks are filters of that one
+aggregation, so they stay lazy and are computed once when joined in the same
+plan; deeper levels or additional metrics need no extra code.
+"""
+
+from typing import Dict, List, Optional
+
+import polars as pl
+
+LEVEL_COL = "level"
+CODE_COL = "czso_code"
+YEAR_COL = "year"
+METRIC_COL = "metric"
+VALUE_COL = "value"
+NAME_COL = "name_en"
+
+
+def sector_prefix(level: int) -> str:
+    return f"sector_level{level}_"
+
+
+def sector_name_col(level: int) -> str:
+    return f"level{level}_nace_en_name"
+
+
+def sector_blocks(
+    long: pl.LazyFrame,
+    levels: Optional[List[int]] = None,
+    metrics: Optional[List[str]] = None,
+) -> Dict[int, pl.LazyFrame]:
+    """
+    Wide sector block per level: `czso_code`, `year`, the prefixed metric
+    columns (in order of first appearance) and the level's name column.
+
+    `levels` and `metrics` default to all values present in `long`, read
+    with one small `unique` over those two columns; pass them to keep the
+    pivot fully lazy. `long` must be unique on (level, code, year, metric),
+    which callers check beforehand (`utils.join_contracts.check_unique`);
+    otherwise the first value of a duplicated key is kept.
+    """
+    if levels is None or metrics is None:
+        present = long.select(LEVEL_COL, METRIC_COL).unique(maintain_order=True).collect()
+        levels = levels if levels is not None else sorted(present[LEVEL_COL].unique().to_list())
+        metrics = metrics if metrics is not None else present[METRIC_COL].unique(maintain_order=True).to_list()
+
+    long = long.filter(pl.col(LEVEL_COL).is_in(levels))
+
+    wide = (
+        long.group_by([LEVEL_COL, CODE_COL, YEAR_COL])
+        .agg(
+            [pl.col(VALUE_COL).filter(pl.col(METRIC_COL) == m).first().alias(m) for m in metrics]
+            + [pl.col(NAME_COL).first()]
+        )
+    )
+    return {
+        level: (
+            wide.filter(pl.col(LEVEL_COL) == level)
+            .select(
+                [CODE_COL, YEAR_COL]
+                + [pl.col(m).alias(f"{sector_prefix(level)}{m}") for m in metrics]
+                + [pl.col(NAME_COL).alias(sector_name_col(level))]
+            )
+            .sort([CODE_COL, YEAR_COL])
+        )
+        for level in levels
+    }
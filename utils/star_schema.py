@@ -0,0 +1,147 @@
+"""
+Star-schema storage of the merged panel.
+
+Macro indicators are constant within a year and sector indicators within a
+(sector, year), so instead of repeating them on every firm-year row the merge
+writes four tables into one directory:
+
+- ``firm_facts.parquet``     one row per firm-year (firm_* columns + keys)
+- ``sector_level1.parquet``  one row per (level1_code, year)
+- ``sector_level2.parquet``  one row per (level2_code, year)
+- ``macro.parquet``          one row per year
+
+`scan_star` returns a lazy view with the layout of the former wide panel and
+joins a dimension only when one of its columns is requested;
+`join_dimensions` does the same joins onto any frame that carries the keys.
+"""
+
+import os
+from typing import Dict, List, Optional, Union
+
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+YEAR_COL = "year"
+FACT_TABLE = "firm"
+STAR_FILES = {
+    "firm": "firm_facts.parquet",
+    "level1": "sector_level1.parquet",
+    "level2": "sector_level2.parquet",
+    "macro": "macro.parquet",
+}
+# Join keys of each dimension, as named in the fact table
+DIM_KEYS = {
+    "level1": ["level1_code", YEAR_COL],
+    "level2": ["level2_code", YEAR_COL],
+    "macro": [YEAR_COL],
+}
+DIM_PREFIXES = {
+    "level1": ("sector_level1_", "level1_nace_en_name"),
+    "level2": ("sector_level2_", "level2_nace_en_name"),
+    "macro": ("mac_",),
+}
+
+
+def star_paths(star_dir: str) -> Dict[str, str]:
+    """Paths of the four tables inside a star directory."""
+    return {table: os.path.join(star_dir, name) for table, name in STAR_FILES.items()}
+
+
+def _check_unique(lf: pl.LazyFrame, keys: List[str], table: str) -> None:
+    counts = lf.group_by(keys).len().select(pl.col("len").max()).collect()
+    if counts.height and (counts.item() or 0) > 1:
+        raise ValueError(f"Dimension '{table}' is not unique on {keys}")
+
+
+def write_star(
+    star_dir: str,
+    firm: Frame,
+    level1: Frame,
+    level2: Frame,
+    macro: Frame,
+    compression: str = "snappy",
+    only: Optional[List[str]] = None,
+) -> Dict[str, str]:
+    """
+    Write the firm fact table and the three dimensions to `star_dir`
+    (`write_star(star_dir, **split_panel(panel))` converts a wide panel).
+
+    Dimensions must carry the join keys under the fact-table names
+    (`level1_code`/`level2_code`, `year`) and be unique on them. With `only`,
+    just those tables are rewritten and the other files are left untouched.
+    """
+    os.makedirs(star_dir, exist_ok=True)
+    paths = star_paths(star_dir)
+    tables = {"firm": firm, "level1": level1, "level2": level2, "macro": macro}
+    for table, frame in tables.items():
+        if only is not None and table not in only:
+            continue
+        lf = frame.lazy()
+        if table in DIM_KEYS:
+            _check_unique(lf, DIM_KEYS[table], table)
+        lf.sink_parquet(paths[table], compression=compression)
+    return paths
+
+
+def split_panel(panel: Frame) -> Dict[str, pl.LazyFrame]:
+    """
+    Split a wide merged panel into fact and dimension frames by column prefix
+    (`sector_level1_*`, `sector_level2_*`, `mac_*` and the NACE name columns).
+    """
+    lf = panel.lazy()
+    names = lf.collect_schema().names()
+    dim_cols = {
+        table: [c for c in names if c.startswith(prefixes)]
+        for table, prefixes in DIM_PREFIXES.items()
+    }
+    in_dims = {c for cols in dim_cols.values() for c in cols}
+    tables = {"firm": lf.select([c for c in names if c not in in_dims])}
+    for table, cols in dim_cols.items():
+        keys = DIM_KEYS[table]
+        tables[table] = (
+            lf.select(keys + cols)
+            .filter(pl.all_horizontal(pl.col(k).is_not_null() for k in keys))
+            .unique(subset=keys, keep="first")
+            .sort(keys)
+        )
+    return tables
+
+
+def join_dimensions(facts: Frame, star_dir: str, columns: Optional[List[str]] = None) -> pl.LazyFrame:
+    """
+    Lazily left-join the dimension columns of `star_dir` onto `facts`, which
+    carries the dimension keys (e.g. the fact table, or a frame derived from
+    it). With `columns`, only the dimension columns among them are joined.
+    """
+    paths = star_paths(star_dir)
+    view = facts.lazy()
+    wanted = set(columns) if columns is not None else None
+    for table, keys in DIM_KEYS.items():
+        dim = pl.scan_parquet(paths[table])
+        dim_cols = [c for c in dim.collect_schema().names() if c not in keys]
+        needed = dim_cols if wanted is None else [c for c in dim_cols if c in wanted]
+        if needed:
+            view = view.join(dim.select(keys + needed), on=keys, how="left", maintain_order="left")
+    return view
+
+
+def scan_star(star_dir: str, columns: Optional[List[str]] = None) -> pl.LazyFrame:
+    """
+    Lazy view of the merged panel.
+
+    With `columns`, only the dimensions that provide one of them are joined
+    and the result is projected to `columns` (in that order). Without it, the
+    full wide layout (firm, level 1, level 2, macro columns) is returned.
+    """
+    paths = star_paths(star_dir)
+    view = join_dimensions(pl.scan_parquet(paths[FACT_TABLE]), star_dir, columns)
+    if columns is None:
+        return view
+    available = set(pl.scan_parquet(paths[FACT_TABLE]).collect_schema().names())
+    for table in DIM_KEYS:
+        available.update(pl.scan_parquet(paths[table]).collect_schema().names())
+    missing = [c for c in columns if c not in available]
+    if missing:
+        raise KeyError(f"Columns not found in star schema {star_dir}: {missing}")
+    return view.select(columns)
@@ -0,0 +1,377 @@
+"""
+Batched winsorisation of panel variables.
+
+All (group, column) quantile pairs are computed in a single group-by pass and
+the clipping is applied in the same lazy plan (`bounds_plan` is joined onto
+the frame, so a lazy input stays one plan). For panels that do not fit in
+memory, `tdigest_bounds` builds mergeable t-digest sketches per (group, column)
+over any sequence of partitions (e.g. Parquet record batches) and returns
+approximate bounds in the same format, which `apply_bounds` then clips lazily.
+"""
+
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import polars as pl
+
+Frame = Union[pl.DataFrame, pl.LazyFrame]
+
+WINSOR_LOWER_Q = 0.01
+WINSOR_UPPER_Q = 0.99
+TDIGEST_COMPRESSION = 200       # delta: ~delta/2 centroids per sketch
+TDIGEST_BUFFER_SIZE = 50_000    # raw values buffered before compressing
+BATCH_SIZE = 1_000_000          # rows per partition when iterating a frame
+
+LOWER_SUFFIX = "__lower"
+UPPER_SUFFIX = "__upper"
+
+
+def _lower(col: str) -> str:
+    return f"{col}{LOWER_SUFFIX}"
+
+
+def _upper(col: str) -> str:
+    return f"{col}{UPPER_SUFFIX}"
+
+
+# =============================================================================
+# Exact bounds
+# =============================================================================
+
+def bounds_plan(
+    df: Frame,
+    cols: List[str],
+    by: Optional[str] = "year",
+    lower_q: float = WINSOR_LOWER_Q,
+    upper_q: float = WINSOR_UPPER_Q,
+    interpolation: str = "nearest",
+) -> pl.LazyFrame:
+    """
+    Lazy aggregation of the lower/upper quantile bounds of every column.
+
+    One row per `by` group (or a single row when `by` is None) with the
+    columns `<col>__lower` and `<col>__upper`. Non-finite values are ignored.
+    """
+    lf = df.lazy()
+    aggs = []
+    for col in cols:
+        clean = pl.when(pl.col(col).is_finite()).then(pl.col(col))
+        aggs.append(clean.quantile(lower_q, interpolation).alias(_lower(col)))
+        aggs.append(clean.quantile(upper_q, interpolation).alias(_upper(col)))
+
+    if by is None:
+        return lf.select(aggs)
+    return lf.group_by(by).agg(aggs).sort(by)
+
+
+def winsorization_bounds(
+    df: Frame,
+    cols: List[str],
+    by: Optional[str] = "year",
+    lower_q: float = WINSOR_LOWER_Q,
+    upper_q: float = WINSOR_UPPER_Q,
+    interpolation: str = "nearest",
+) -> pl.DataFrame:
+    """`bounds_plan`, collected: the bounds as a table (e.g. to inspect or store them)."""
+    return bounds_plan(df, cols, by, lower_q, upper_q, interpolation).collect()
+
+
+def apply_bounds(
+    df: Frame,
+    bounds: Union[pl.DataFrame, pl.LazyFrame],
+    cols: List[str],
+    by: Optional[str] = "year",
+    floors: Optional[Dict[str, float]] = None,
+    drop_outliers: bool = False,
+) -> Frame:
+    """
+    Clip (or drop) values outside bounds, in one `with_columns`.
+
+    `bounds` is a table from `winsorization_bounds` / `tdigest_bounds` or a
+    lazy `bounds_plan`; a lazy plan is joined onto the frame (on `by`, or as
+    a one-row cross join when `by` is None) so nothing is collected here.
+    `floors` replaces the lower quantile of a column by a fixed economic
+    constraint (e.g. non-negative cost ratios); floors are always clipped, even
+    when `drop_outliers` is set. With `drop_outliers`, a row is removed if any
+    column lies outside its quantile bounds (all columns against the given
+    bounds at once; `winsorize` drops column by column).
+    """
+    floors = floors or {}
+    is_lazy = isinstance(df, pl.LazyFrame)
+    lf = df.lazy()
+
+    bound_cols = [_lower(c) for c in cols] + [_upper(c) for c in cols]
+    joined = by is not None or isinstance(bounds, pl.LazyFrame)
+    if not joined:
+        row = bounds.row(0, named=True)
+        lo = {c: pl.lit(row[_lower(c)]) for c in cols}
+        hi = {c: pl.lit(row[_upper(c)]) for c in cols}
+    else:
+        if by is None:
+            lf = lf.join(bounds.lazy().select(bound_cols), how="cross", maintain_order="left")
+        else:
+            lf = lf.join(bounds.lazy().select([by] + bound_cols), on=by, how="left")
+        lo = {c: pl.col(_lower(c)) for c in cols}
+        hi = {c: pl.col(_upper(c)) for c in cols}
+
+    if drop_outliers:
+        inside = [
+            pl.col(c).is_null()
+            | (((pl.col(c) >= lo[c]) | pl.lit(c in floors)) & (pl.col(c) <= hi[c]))
+            for c in cols
+        ]
+        lf = lf.filter(pl.all_horizontal(inside))
+        lf = lf.with_columns([
+            pl.col(c).clip(lower_bound=floors[c]) for c in cols if c in floors
+        ])
+    else:
+        lf = lf.with_columns([
+            pl.col(c).clip(
+                lower_bound=pl.lit(floors[c]) if c in floors else lo[c],
+                upper_bound=hi[c],
+            )
+            for c in cols
+        ])
+
+    if joined:
+        lf = lf.drop(bound_cols)
+    return lf if is_lazy else lf.collect()
+
+
+def winsorize(
+    df: Frame,
+    cols: List[str],
+    by: Optional[str] = "year",
+    lower_q: float = WINSOR_LOWER_Q,
+    upper_q: float = WINSOR_UPPER_Q,
+    floors: Optional[Dict[str, float]] = None,
+    drop_outliers: bool = False,
+    interpolation: str = "nearest",
+    method: str = "exact",
+    compression: int = TDIGEST_COMPRESSION,
+) -> Frame:
+    """
+    Winsorise several columns within `by` groups (per year by default).
+
+    `method="exact"` computes all quantiles in one group-by inside the same
+    lazy plan as the clipping (a lazy input is returned as one lazy plan).
+    `method="tdigest"` streams the frame in partitions of `BATCH_SIZE` rows
+    and clips to approximate bounds.
+
+    With `drop_outliers`, columns are processed one at a time in the order of
+    `cols`: the bounds of a column are computed on the rows that survived the
+    drops of the previous columns (after its floor is applied), so the row set
+    depends on the column order. The input is collected once and the column
+    steps run on that frame.
+    """
+    cols = [c for c in cols if c in df.lazy().collect_schema().names()]
+    if not cols:
+        return df
+    if method not in ("exact", "tdigest"):
+        raise ValueError(f"Unknown winsorisation method '{method}'")
+
+    def bounds_of(frame: Frame, bound_cols: List[str]) -> Union[pl.DataFrame, pl.LazyFrame]:
+        if method == "tdigest":
+            return tdigest_bounds(iter_frame_batches(frame, bound_cols, by), bound_cols, by,
+                                  lower_q, upper_q, compression)
+        return bounds_plan(frame, bound_cols, by, lower_q, upper_q, interpolation)
+
+    if not drop_outliers:
+        return apply_bounds(df, bounds_of(df, cols), cols, by, floors)
+
+    floors = floors or {}
+    is_lazy = isinstance(df, pl.LazyFrame)
+    frame = df.collect() if is_lazy else df
+    for col in cols:
+        if col in floors:
+            frame = frame.with_columns(pl.col(col).clip(lower_bound=floors[col]))
+        frame = apply_bounds(frame, bounds_of(frame, [col]), [col], by, floors, drop_outliers=True)
+    return frame.lazy() if is_lazy else frame
+
+
+# =============================================================================
+# Approximate bounds (mergeable t-digest)
+# =============================================================================
+
+class TDigest:
+    """
+    Mergeable t-digest sketch (Dunning & Ertl) with the k1 (arcsine) scale.
+
+    Compression is vectorised: sorted centroids are bucketed by the integer
+    part of k(q), so each bucket spans at most one unit of the scale function
+    and the tails keep near-singleton centroids. Two digests of disjoint
+    partitions merge into a digest of their union.
+    """
+
+    def __init__(self, compression: int = TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = math.inf
+        self.max = -math.inf
+        self._pending_means: List[np.ndarray] = []
+        self._pending_weights: List[np.ndarray] = []
+        self._pending_size = 0
+
+    @property
+    def count(self) -> float:
+        self._compress()
+        return float(self.weights.sum())
+
+    def update(self, values) -> "TDigest":
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if values.size:
+            self._add(values, np.ones_like(values))
+        return self
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        other._compress()
+        if other.means.size:
+            self._add(other.means, other.weights)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self.means.size:
+            return None
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate(([0.0], centers, [total]))
+        values = np.concatenate(([self.min], self.means, [self.max]))
+        return float(np.interp(q * total, positions, values))
+
+    def _add(self, means: np.ndarray, weights: np.ndarray) -> None:
+        self.min = min(self.min, float(means.min()))
+        self.max = max(self.max, float(means.max()))
+        self._pending_means.append(means)
+        self._pending_weights.append(weights)
+        self._pending_size += means.size
+        if self._pending_size >= TDIGEST_BUFFER_SIZE:
+            self._compress()
+
+    def _compress(self) -> None:
+        if not self._pending_means:
+            return
+        means = np.concatenate([self.means] + self._pending_means)
+        weights = np.concatenate([self.weights] + self._pending_weights)
+        self._pending_means, self._pending_weights, self._pending_size = [], [], 0
+
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * math.pi) * np.arcsin(2 * q_mid - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)
+
+        starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+        bucket_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / bucket_weights
+        self.weights = bucket_weights
+
+
+def iter_frame_batches(
+    df: Frame,
+    cols: List[str],
+    by: Optional[str] = "year",
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[pl.DataFrame]:
+    """
+    Yield the required columns of a (lazy) frame in row partitions; a lazy
+    plan is executed once, by the streaming engine.
+    """
+    select = ([by] if by is not None else []) + cols
+    if isinstance(df, pl.DataFrame):
+        yield from df.select(select).iter_slices(batch_size)
+        return
+    yield from df.select(select).collect_batches(chunk_size=batch_size, maintain_order=False)
+
+
+def iter_parquet_batches(
+    path: str,
+    cols: List[str],
+    by: Optional[str] = "year",
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[pl.DataFrame]:
+    """Yield record batches of a Parquet file without materialising the file."""
+    import pyarrow.parquet as pq
+
+    select = ([by] if by is not None else []) + cols
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=select):
+        yield pl.from_arrow(batch)
+
+
+def tdigest_sketches(
+    batches: Iterable[pl.DataFrame],
+    cols: List[str],
+    by: Optional[str] = "year",
+    compression: int = TDIGEST_COMPRESSION,
+) -> Dict[tuple, TDigest]:
+    """
+    Build one t-digest per (group, column) over a stream of partitions.
+
+    The result is keyed by `(group_value, column)` (group_value is None when
+    `by` is None) and can be merged with sketches from other partitions or
+    workers via `merge_sketches`.
+    """
+    sketches: Dict[tuple, TDigest] = {}
+    for batch in batches:
+        parts = batch.partition_by(by, as_dict=True) if by is not None else {(None,): batch}
+        for key, part in parts.items():
+            group = key[0] if isinstance(key, tuple) else key
+            for col in cols:
+                values = part.get_column(col).drop_nulls().to_numpy()
+                sketch = sketches.setdefault((group, col), TDigest(compression))
+                sketch.update(values)
+    return sketches
+
+
+def merge_sketches(*sketch_sets: Dict[tuple, TDigest]) -> Dict[tuple, TDigest]:
+    """Merge per-(group, column) sketches computed on disjoint partitions."""
+    merged: Dict[tuple, TDigest] = {}
+    for sketches in sketch_sets:
+        for key, sketch in sketches.items():
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = TDigest(sketch.compression).merge(sketch)
+    return merged
+
+
+def sketches_to_bounds(
+    sketches: Dict[tuple, TDigest],
+    cols: List[str],
+    by: Optional[str] = "year",
+    lower_q: float = WINSOR_LOWER_Q,
+    upper_q: float = WINSOR_UPPER_Q,
+) -> pl.DataFrame:
+    """Convert sketches into the bounds format returned by `winsorization_bounds`."""
+    groups = sorted({g for g, _ in sketches}, key=lambda g: (g is None, g))
+    rows = []
+    for group in groups:
+        row = {by: group} if by is not None else {}
+        for col in cols:
+            sketch = sketches.get((group, col))
+            row[_lower(col)] = sketch.quantile(lower_q) if sketch else None
+            row[_upper(col)] = sketch.quantile(upper_q) if sketch else None
+        rows.append(row)
+    schema = {name: pl.Float64 for c in cols for name in (_lower(c), _upper(c))}
+    bounds = pl.DataFrame(rows, schema_overrides=schema)
+    return bounds.select(([by] if by is not None else []) + list(schema))
+
+
+def tdigest_bounds(
+    batches: Iterable[pl.DataFrame],
+    cols: List[str],
+    by: Optional[str] = "year",
+    lower_q: float = WINSOR_LOWER_Q,
+    upper_q: float = WINSOR_UPPER_Q,
+    compression: int = TDIGEST_COMPRESSION,
+) -> pl.DataFrame:
+    """Approximate winsorisation bounds from a stream of partitions."""
+    sketches = tdigest_sketches(batches, cols, by, compression)
+    return sketches_to_bounds(sketches, cols, by, lower_q, upper_q)